@@ -0,0 +1,28 @@
+"""add_rendition_path_to_photos
+
+Revision ID: a3c9e5f71d08
+Revises: f5b8d2e43a19
+Create Date: 2026-10-18 18:05:12.407391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c9e5f71d08'
+down_revision: Union[str, Sequence[str], None] = 'f5b8d2e43a19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('photos', sa.Column('rendition_path', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('photos', 'rendition_path')
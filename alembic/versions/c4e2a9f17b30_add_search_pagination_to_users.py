@@ -0,0 +1,30 @@
+"""add_search_pagination_to_users
+
+Revision ID: c4e2a9f17b30
+Revises: b1d87e7498ad
+Create Date: 2026-10-18 12:10:42.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e2a9f17b30'
+down_revision: Union[str, Sequence[str], None] = 'b1d87e7498ad'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('search_offset', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('search_done', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'search_done')
+    op.drop_column('users', 'search_offset')
@@ -0,0 +1,35 @@
+"""add_no_photo_candidates
+
+Revision ID: d7f3b1c85e42
+Revises: c4e2a9f17b30
+Create Date: 2026-10-18 14:02:17.904615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7f3b1c85e42'
+down_revision: Union[str, Sequence[str], None] = 'c4e2a9f17b30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('no_photo_candidates',
+    sa.Column('vk_user_id', sa.BigInteger(), nullable=False),
+    sa.Column('reason', sa.String(length=32), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('vk_user_id')
+    )
+    op.create_index(op.f('ix_no_photo_candidates_expires_at'), 'no_photo_candidates', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_no_photo_candidates_expires_at'), table_name='no_photo_candidates')
+    op.drop_table('no_photo_candidates')
@@ -0,0 +1,28 @@
+"""add_is_closed_to_profiles
+
+Revision ID: e1a4c6d92b57
+Revises: d7f3b1c85e42
+Create Date: 2026-10-18 15:21:08.551730
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a4c6d92b57'
+down_revision: Union[str, Sequence[str], None] = 'd7f3b1c85e42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('profiles', sa.Column('is_closed', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('profiles', 'is_closed')
@@ -0,0 +1,28 @@
+"""add_display_url_to_photos
+
+Revision ID: f5b8d2e43a19
+Revises: e1a4c6d92b57
+Create Date: 2026-10-18 16:47:33.120584
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5b8d2e43a19'
+down_revision: Union[str, Sequence[str], None] = 'e1a4c6d92b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('photos', sa.Column('display_url', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('photos', 'display_url')
@@ -0,0 +1,374 @@
+# Локальный фейковый VK API для нагрузочного тестирования и замеров задержек без сети.
+#
+# Запуск:
+#   python intests/fake_vk_server.py --port 8081 --latency-ms 80 --error-rate 0.01 --rate-limit 3
+# Бот против фейка:
+#   VK_API_BASE_URL=http://127.0.0.1:8081/method python -m src.main
+#
+# Отдаёт users.get, users.search, photos.get, database.getCities и execute
+# на сгенерированных (детерминированных по --seed) данных, плюс CDN фото
+# /cdn/<owner_id>/<photo_id>_<size>.jpg с синтетическими JPEG нужного размера.
+# Любой токен считается валидным.
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+import time
+import zlib
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass
+from typing import Any
+
+from aiohttp import web
+
+try:
+    import cv2
+    import numpy as np
+    _HAS_CV2 = True
+except ImportError:
+    _HAS_CV2 = False
+
+# серый JPEG 8x8 — если cv2 не установлен, CDN отдаёт его для любого размера
+_STUB_JPEG = base64.b64decode(
+    '/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9PDkzODdASFxOQERXRTc4UG1RV19i'
+    'Z2hnPk1xeXBkeFxlZ2P/2wBDARESEhgVGC8aGi9jQjhCY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2Nj'
+    'Y2NjY2NjY2NjY2P/wAARCAAIAAgDASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIE'
+    'AwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpT'
+    'VFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ'
+    '2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3'
+    'AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpj'
+    'ZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn'
+    '6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwAooooA/9k='
+)
+
+# размеры VK: тип → длинная сторона (портрет 3:4)
+_PHOTO_SIZES = {
+    's': 75, 'm': 130, 'o': 130, 'p': 200, 'q': 320, 'r': 510,
+    'x': 604, 'y': 807, 'z': 1080, 'w': 2560,
+}
+
+_FIRST_NAMES = {
+    1: ['Анна', 'Мария', 'Елена', 'Ольга', 'Дарья', 'Ксения', 'Алина', 'Юлия'],
+    2: ['Иван', 'Пётр', 'Алексей', 'Дмитрий', 'Сергей', 'Максим', 'Артём', 'Кирилл'],
+}
+_LAST_NAMES = {
+    1: ['Иванова', 'Петрова', 'Смирнова', 'Кузнецова', 'Попова', 'Соколова'],
+    2: ['Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов'],
+}
+
+# VK отдаёт не больше 1000 результатов на один users.search
+_SEARCH_CAP = 1000
+_USER_ID_STRIDE = 1_000_000
+
+
+@dataclass
+class FakeVkConfig:
+    """Параметры генерации данных и инъекции сбоев."""
+    seed: int = 42
+    users_per_city: int = 3000
+    latency_ms: float = 0.0          # средняя задержка ответа API
+    jitter_ms: float = 0.0           # разброс задержки API (гаусс)
+    cdn_latency_ms: float = 0.0      # задержка CDN фото
+    error_rate: float = 0.0          # доля ответов "error 10: Internal server error"
+    rate_limit: float = 0.0          # запросов/сек на токен, сверх — error 6 (0 = без лимита)
+    closed_ratio: float = 0.2        # доля закрытых профилей
+    no_photo_ratio: float = 0.1      # доля профилей без фото
+
+
+class FakeVkError(Exception):
+    def __init__(self, code: int, msg: str):
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+
+
+class FakeVk:
+    """Генератор данных и обработчики методов фейкового VK."""
+
+    def __init__(self, cfg: FakeVkConfig):
+        self.cfg = cfg
+        self._rng = random.Random(cfg.seed)
+        self._requests: dict[str, deque] = defaultdict(deque)
+        self._jpeg_cache: OrderedDict[tuple[int, int, int], bytes] = OrderedDict()
+        self._cities: dict[int, list[dict[str, Any]]] = {}
+        self.stats: dict[str, int] = defaultdict(int)
+
+    # ---------- генерация данных ----------
+
+    def _user(self, user_id: int) -> dict[str, Any]:
+        rnd = random.Random(self.cfg.seed * 7919 + user_id)
+        sex = rnd.choice((1, 2))
+        city_id = max(1, user_id // _USER_ID_STRIDE)
+        has_photo = rnd.random() >= self.cfg.no_photo_ratio
+        return {
+            'id': user_id,
+            'first_name': rnd.choice(_FIRST_NAMES[sex]),
+            'last_name': rnd.choice(_LAST_NAMES[sex]),
+            'domain': f'id{user_id}',
+            'sex': sex,
+            'age': rnd.randint(18, 60),
+            'birth_month': rnd.randint(1, 12),
+            'city': {'id': city_id, 'title': f'Город {city_id}'},
+            'is_closed': rnd.random() < self.cfg.closed_ratio,
+            'can_access_closed': False,
+            'has_photo': int(has_photo),
+            'photos_count': rnd.randint(1, 15) if has_photo else 0,
+        }
+
+    def _public(self, user: dict[str, Any], fields: str) -> dict[str, Any]:
+        """Поля пользователя в формате ответа VK."""
+        requested = {f.strip() for f in fields.split(',') if f.strip()}
+        out = {
+            'id': user['id'],
+            'first_name': user['first_name'],
+            'last_name': user['last_name'],
+            'is_closed': user['is_closed'],
+            'can_access_closed': user['can_access_closed'],
+        }
+        for f in ('domain', 'city', 'sex', 'has_photo'):
+            if f in requested:
+                out[f] = user[f]
+        if 'counters' in requested:
+            out['counters'] = {'photos': user['photos_count']}
+        return out
+
+    def _city_population(self, city_id: int) -> list[dict[str, Any]]:
+        population = self._cities.get(city_id)
+        if population is None:
+            base = city_id * _USER_ID_STRIDE
+            population = [self._user(base + i) for i in range(1, self.cfg.users_per_city + 1)]
+            self._cities[city_id] = population
+        return population
+
+    # ---------- методы ----------
+
+    def users_get(self, params: dict[str, Any], token: str) -> list[dict[str, Any]]:
+        fields = str(params.get('fields', ''))
+        ids = str(params.get('user_ids', '')).strip()
+        if not ids:
+            # владелец токена
+            owner_id = 1 + zlib.crc32(token.encode()) % (_USER_ID_STRIDE - 1)
+            return [self._public(self._user(owner_id), fields)]
+        return [self._public(self._user(int(i)), fields) for i in ids.split(',') if i.strip()]
+
+    def users_search(self, params: dict[str, Any], token: str) -> dict[str, Any]:
+        city_id = int(params.get('city', 1))
+        sex = int(params.get('sex', 0))
+        age_from = int(params.get('age_from', 0) or 0)
+        age_to = int(params.get('age_to', 200) or 200)
+        birth_month = int(params.get('birth_month', 0) or 0)
+        has_photo = int(params.get('has_photo', 0) or 0)
+        offset = int(params.get('offset', 0))
+        count = min(int(params.get('count', 20)), 1000)
+
+        matched = [
+            u for u in self._city_population(city_id)
+            if (not sex or u['sex'] == sex)
+            and age_from <= u['age'] <= age_to
+            and (not birth_month or u['birth_month'] == birth_month)
+            and (not has_photo or u['has_photo'])
+        ]
+        # как VK: за пределами первых 1000 результатов ничего не отдаём
+        window = matched[:_SEARCH_CAP]
+        items = window[offset: min(offset + count, _SEARCH_CAP)]
+        fields = str(params.get('fields', ''))
+        return {'count': len(matched), 'items': [self._public(u, fields) for u in items]}
+
+    def photos_get(self, params: dict[str, Any], token: str, base_url: str) -> dict[str, Any]:
+        owner_id = int(params.get('owner_id', 0))
+        user = self._user(owner_id)
+        if user['is_closed']:
+            raise FakeVkError(30, 'This profile is private')
+
+        rnd = random.Random(self.cfg.seed * 104729 + owner_id)
+        count = min(int(params.get('count', 50)), user['photos_count'])
+        items = []
+        for n in range(count):
+            photo_id = 457239000 + n
+            sizes = []
+            for size_type, long_side in _PHOTO_SIZES.items():
+                w, h = long_side * 3 // 4, long_side
+                sizes.append({
+                    'type': size_type,
+                    'width': w,
+                    'height': h,
+                    'url': f'{base_url}/cdn/{owner_id}/{photo_id}_{size_type}.jpg',
+                })
+            items.append({
+                'id': photo_id,
+                'owner_id': owner_id,
+                'album_id': -6,
+                'sizes': sizes,
+                'likes': {'count': rnd.randint(0, 500), 'user_likes': 0},
+            })
+        return {'count': len(items), 'items': items}
+
+    def database_get_cities(self, params: dict[str, Any], token: str) -> dict[str, Any]:
+        q = str(params.get('q', '')).strip()
+        if not q:
+            return {'count': 0, 'items': []}
+        city_id = 1 + zlib.crc32(q.lower().encode()) % 999
+        return {'count': 1, 'items': [{'id': city_id, 'title': q}]}
+
+    def dispatch(self, method: str, params: dict[str, Any], token: str, base_url: str) -> Any:
+        self.stats[method] += 1
+        if method == 'users.get':
+            return self.users_get(params, token)
+        if method == 'users.search':
+            return self.users_search(params, token)
+        if method == 'photos.get':
+            return self.photos_get(params, token, base_url)
+        if method == 'database.getCities':
+            return self.database_get_cities(params, token)
+        raise FakeVkError(3, f'Unknown method passed: {method}')
+
+    def execute(self, code: str, token: str, base_url: str) -> dict[str, Any]:
+        """Разбирает VKScript вида return [API.m({...}),...]; (как собирает VkBatcher)."""
+        decoder = json.JSONDecoder()
+        results = []
+        errors = []
+        for match in re.finditer(r'API\.([\w.]+)\(', code):
+            method = match.group(1)
+            params, _ = decoder.raw_decode(code, match.end())
+            try:
+                results.append(self.dispatch(method, params, token, base_url))
+            except FakeVkError as e:
+                results.append(False)
+                errors.append({'method': method, 'error_code': e.code, 'error_msg': e.msg})
+        out: dict[str, Any] = {'response': results}
+        if errors:
+            out['execute_errors'] = errors
+        return out
+
+    # ---------- инъекции ----------
+
+    def check_rate_limit(self, token: str) -> None:
+        if self.cfg.rate_limit <= 0:
+            return
+        now = time.monotonic()
+        window = self._requests[token]
+        while window and now - window[0] > 1.0:
+            window.popleft()
+        if len(window) >= self.cfg.rate_limit:
+            raise FakeVkError(6, 'Too many requests per second')
+        window.append(now)
+
+    async def api_delay(self) -> None:
+        delay = self._rng.gauss(self.cfg.latency_ms, self.cfg.jitter_ms) if self.cfg.jitter_ms else self.cfg.latency_ms
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    # ---------- CDN ----------
+
+    def jpeg(self, width: int, height: int, variant: int) -> bytes:
+        """Синтетический JPEG (кэшируется по размеру и варианту)."""
+        if not _HAS_CV2:
+            return _STUB_JPEG
+
+        key = (width, height, variant)
+        data = self._jpeg_cache.get(key)
+        if data is not None:
+            self._jpeg_cache.move_to_end(key)
+            return data
+
+        rnd = np.random.default_rng(variant)
+        small = rnd.integers(0, 256, size=(8, 6, 3), dtype=np.uint8)
+        img = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+        cv2.ellipse(
+            img, (width // 2, height // 2), (width // 5, height // 4), 0, 0, 360,
+            tuple(int(c) for c in rnd.integers(0, 256, size=3)), -1,
+        )
+        ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        data = buf.tobytes() if ok else _STUB_JPEG
+
+        self._jpeg_cache[key] = data
+        while len(self._jpeg_cache) > 64:
+            self._jpeg_cache.popitem(last=False)
+        return data
+
+
+def create_app(cfg: FakeVkConfig | None = None) -> web.Application:
+    """aiohttp-приложение фейкового VK (удобно поднимать прямо из бенчмарков)."""
+    fake = FakeVk(cfg or FakeVkConfig())
+    app = web.Application()
+    app['fake_vk'] = fake
+
+    async def api(request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params: dict[str, Any] = dict(request.query)
+        if request.method == 'POST':
+            params.update(await request.post())
+        token = str(params.pop('access_token', ''))
+        params.pop('v', None)
+        base_url = f'{request.scheme}://{request.host}'
+
+        await fake.api_delay()
+        try:
+            if not token:
+                raise FakeVkError(5, 'User authorization failed: no access_token passed.')
+            fake.check_rate_limit(token)
+            if fake.cfg.error_rate and fake._rng.random() < fake.cfg.error_rate:
+                raise FakeVkError(10, 'Internal server error')
+
+            if method == 'execute':
+                return web.json_response(fake.execute(str(params.get('code', '')), token, base_url))
+            return web.json_response({'response': fake.dispatch(method, params, token, base_url)})
+        except FakeVkError as e:
+            return web.json_response({'error': {
+                'error_code': e.code,
+                'error_msg': e.msg,
+                'request_params': [{'key': 'method', 'value': method}],
+            }})
+
+    async def cdn(request: web.Request) -> web.Response:
+        size_type = request.match_info['size']
+        long_side = _PHOTO_SIZES.get(size_type)
+        if long_side is None:
+            raise web.HTTPNotFound()
+        if fake.cfg.cdn_latency_ms:
+            await asyncio.sleep(fake.cfg.cdn_latency_ms / 1000)
+        fake.stats['cdn'] += 1
+        variant = (int(request.match_info['owner_id']) + int(request.match_info['photo_id'])) % 16
+        body = fake.jpeg(long_side * 3 // 4, long_side, variant)
+        return web.Response(body=body, content_type='image/jpeg')
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(dict(fake.stats))
+
+    app.router.add_route('*', '/method/{method}', api)
+    app.router.add_get(r'/cdn/{owner_id:-?\d+}/{photo_id:\d+}_{size:[a-z]}.jpg', cdn)
+    app.router.add_get('/stats', stats)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Фейковый VK API для локальных замеров')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users-per-city', type=int, default=3000)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--cdn-latency-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=0.0)
+    args = parser.parse_args()
+
+    cfg = FakeVkConfig(
+        seed=args.seed,
+        users_per_city=args.users_per_city,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        cdn_latency_ms=args.cdn_latency_ms,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+    )
+    print(f'Fake VK API: http://{args.host}:{args.port}/method  (VK_API_BASE_URL)')
+    web.run_app(create_app(cfg), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
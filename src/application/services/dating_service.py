@@ -1,14 +1,72 @@
 # предыдущий/следующий кандидат + показать карточку
 
+import asyncio
+import contextvars
 import logging
 from dataclasses import dataclass, field
+from src.infrastructure.vk.batcher import EXECUTE_MAX_CALLS
 from src.infrastructure.vk.methods import VkMethods
+from src.infrastructure.vk.rate_limiter import background_priority, current_priority, raise_priority
 from src.infrastructure.db.repositories import UserRepo, ProfileDTO
-from src.core.config import PHOTO_BUFFER_AHEAD
+from src.application.services.profile_refresh_service import profile_from_vk
+from src.core.config import (
+    PHOTO_BUFFER_AHEAD, QUEUE_PAGE_SIZE, QUEUE_REFILL_THRESHOLD,
+    SEARCH_SLICING, SEARCH_CONCURRENCY, SEARCH_MONTH_SLICE_MAX_AGES,
+    VK_EXECUTE_BATCHING, VK_RATE_BURST,
+)
 
 logger = logging.getLogger(__name__)
 
 PRELOAD_BUFFER = PHOTO_BUFFER_AHEAD  # количество анкет, подготовленных впереди курсора
+SEARCH_RESULTS_CAP = 1000            # users.search отдаёт не больше 1000 результатов
+MAX_EMPTY_PAGES = 3                  # сколько страниц подряд без новых кандидатов листать за раз
+MIN_SLICE_PAGE = 10                  # минимальный размер страницы одного среза
+
+
+@dataclass(frozen=True)
+class SearchSlice:
+    """Срез поиска: поддиапазон возрастов (и, возможно, месяц рождения)."""
+    age_from: int
+    age_to: int
+    birth_month: int | None = None
+
+
+@dataclass
+class _SearchRound:
+    """Круг обхода срезов на одном offset: размер страницы среза и ещё не запрошенные срезы."""
+    offset: int
+    count: int
+    pending: list[SearchSlice]
+
+
+def search_concurrency() -> int:
+    """
+    Сколько срезов запрашивать одновременно. По умолчанию (SEARCH_CONCURRENCY=0) —
+    сколько вызовов помещается в бюджет лимитера без ожидания: с батчингом это
+    VK_RATE_BURST запросов execute по EXECUTE_MAX_CALLS вызовов, без него —
+    VK_RATE_BURST запросов. Больше параллельных вызовов только встанут в очередь лимитера.
+    """
+    if SEARCH_CONCURRENCY > 0:
+        return SEARCH_CONCURRENCY
+    burst = max(1, int(VK_RATE_BURST))
+    return burst * EXECUTE_MAX_CALLS if VK_EXECUTE_BATCHING else burst
+
+
+def plan_search_slices(age_from: int, age_to: int) -> list[SearchSlice]:
+    """
+    Делит диапазон возрастов фильтра на срезы, каждый со своим лимитом
+    в 1000 результатов users.search:
+    - по одному возрасту;
+    - если возрастов не больше SEARCH_MONTH_SLICE_MAX_AGES — ещё и по месяцу рождения.
+    При SEARCH_SLICING=false — один срез на весь диапазон.
+    """
+    if not SEARCH_SLICING or age_to < age_from:
+        return [SearchSlice(age_from, age_to)]
+
+    ages = range(age_from, age_to + 1)
+    if len(ages) <= SEARCH_MONTH_SLICE_MAX_AGES:
+        return [SearchSlice(age, age, month) for age in ages for month in range(1, 13)]
+    return [SearchSlice(age, age) for age in ages]
 
 
 @dataclass
@@ -16,6 +74,16 @@ class DatingService:
     vk: VkMethods
     user_repo: UserRepo
     _photo_service: object | None = field(default=None, repr=False)
+    # загрузки страниц users.search в процессе: tg_user_id → (задача, её контекст)
+    _page_loads: dict[int, tuple[asyncio.Task, contextvars.Context]] = field(default_factory=dict, repr=False)
+    # загрузка страницы и смена фильтров пользователя не идут одновременно
+    _search_locks: dict[int, asyncio.Lock] = field(default_factory=dict, repr=False)
+    # исчерпанные срезы поиска и текущий круг обхода: tg_user_id → состояние.
+    # Держим в памяти намеренно: после рестарта круг начнётся заново с сохранённого
+    # search_offset (повторы отсеет append_queue), а исчерпанный срез вернёт
+    # пустую страницу и снова попадёт сюда — одним лишним вызовом на срез
+    _exhausted_slices: dict[int, set[SearchSlice]] = field(default_factory=dict, repr=False)
+    _rounds: dict[int, _SearchRound] = field(default_factory=dict, repr=False)
 
     async def resolve_city_id(self, access_token: str, city_name: str) -> int | None:
         """
@@ -33,17 +101,115 @@ class DatingService:
             return None
         return int(items[0]["id"])
 
+    async def update_filters(
+            self,
+            tg_user_id: int,
+            city: str,
+            gender: int,
+            age_from: int,
+            age_to: int,
+    ) -> None:
+        """
+        Смена фильтров: сохраняет их и сбрасывает очередь и пагинацию поиска.
+        Загрузка страницы по старым фильтрам отменяется — иначе она дописала бы
+        в новую очередь кандидатов старых фильтров и перезаписала search_offset/
+        search_done. Загрузки, начатые во время сброса, ждут его на блокировке
+        поиска и читают уже новые фильтры.
+        """
+        entry = self._page_loads.get(tg_user_id)
+        if entry is not None:
+            entry[0].cancel()
+
+        async with self._search_lock(tg_user_id):
+            await self.user_repo.update_filters(
+                tg_user_id=tg_user_id,
+                city=city,
+                gender=gender,
+                age_from=age_from,
+                age_to=age_to,
+            )
+            self._exhausted_slices.pop(tg_user_id, None)
+            self._rounds.pop(tg_user_id, None)
+
+    def _search_lock(self, tg_user_id: int) -> asyncio.Lock:
+        lock = self._search_locks.get(tg_user_id)
+        if lock is None:
+            lock = self._search_locks[tg_user_id] = asyncio.Lock()
+        return lock
+
     async def ensure_queue(self, tg_user_id: int) -> None:
         """
-        Если очередь пуста — резолвим city_id, делаем users.search,
-        сохраняем профили кандидатов и очередь VK_ID.
+        Если очередь пуста — загружаем первую страницу users.search
+        (резолвим city_id, сохраняем профили кандидатов и очередь VK_ID).
         """
-        user = await self.user_repo.get_or_create_user(tg_user_id)
         queue = await self.user_repo.get_queue(tg_user_id)
         if queue:
             return
 
-        if not user.vk_access_token:
+        await _wait_page(self._load_next_page(tg_user_id))
+
+    async def _ensure_ahead(self, tg_user_id: int) -> None:
+        """
+        Следит, чтобы впереди курсора были кандидаты:
+        - курсор на последнем кандидате — ждём следующую страницу (иначе некуда идти);
+        - впереди осталось <= QUEUE_REFILL_THRESHOLD — догружаем страницу в фоне.
+        """
+        user = await self.user_repo.get_or_create_user(tg_user_id)
+        if user.search_done:
+            return
+
+        queue = await self.user_repo.get_queue(tg_user_id)
+        remaining = len(queue) - user.history_cursor - 1
+
+        if remaining <= 0:
+            await _wait_page(self._load_next_page(tg_user_id))
+        elif remaining <= QUEUE_REFILL_THRESHOLD:
+            with background_priority():
+                self._load_next_page(tg_user_id)
+
+    def _load_next_page(self, tg_user_id: int) -> asyncio.Task:
+        """
+        Загрузка следующей страницы поиска — не больше одной одновременно на пользователя.
+        Возвращает задачу загрузки: её можно дождаться или оставить работать в фоне.
+        Если фоновую догрузку теперь ждёт пользователь — её следующие VK-вызовы
+        идут интерактивной полосой (как общая обработка фото кандидата).
+        """
+        entry = self._page_loads.get(tg_user_id)
+        if entry is None:
+            ctx = contextvars.copy_context()
+            task = asyncio.create_task(self._fetch_next_page_locked(tg_user_id), context=ctx)
+            self._page_loads[tg_user_id] = task, ctx
+            task.add_done_callback(lambda t: self._on_page_loaded(tg_user_id, t))
+            return task
+
+        task, ctx = entry
+        raise_priority(ctx, current_priority())
+        return task
+
+    def _on_page_loaded(self, tg_user_id: int, task: asyncio.Task) -> None:
+        entry = self._page_loads.get(tg_user_id)
+        if entry is not None and entry[0] is task:
+            del self._page_loads[tg_user_id]
+        # ошибку фоновой загрузки логируем (тот, кто ждал задачу, получит её сам)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning('Очередь: ошибка загрузки страницы поиска для %d: %r', tg_user_id, task.exception())
+
+    async def _fetch_next_page_locked(self, tg_user_id: int) -> None:
+        async with self._search_lock(tg_user_id):
+            await self._fetch_next_page(tg_user_id)
+
+    async def _fetch_next_page(self, tg_user_id: int) -> None:
+        """
+        Запрашивает следующие срезы поиска текущего круга (параллельно, не больше
+        search_concurrency() одновременно; всего ~QUEUE_PAGE_SIZE кандидатов) и дописывает
+        новых кандидатов в конец очереди (очередь и курсор не перезаписываются).
+        Все срезы листаются синхронно — общий offset хранится у пользователя
+        и сдвигается, когда круг по всем неисчерпанным срезам пройден.
+        Если страница не дала новых кандидатов — берёт следующую (до MAX_EMPTY_PAGES).
+        """
+        user = await self.user_repo.get_or_create_user(tg_user_id)
+
+        if not user.vk_access_token or user.search_done:
             return
 
         # фильтры должны быть заполнены
@@ -62,34 +228,112 @@ class DatingService:
             # сохраняем city_id чтобы не резолвить повторно
             user.filter_city_id = city_id
 
-        data = await self.vk.users_search(
-            access_token=user.vk_access_token,
-            city_id=city_id,
-            sex=user.filter_gender,
-            age_from=user.filter_age_from,
-            age_to=user.filter_age_to,
-            count=50,
-        )
+        exhausted = self._exhausted_slices.setdefault(tg_user_id, set())
+        slices = plan_search_slices(user.filter_age_from, user.filter_age_to)
+        semaphore = asyncio.Semaphore(search_concurrency())
 
-        items = data.get("response", {}).get("items", [])
+        for _ in range(MAX_EMPTY_PAGES):
+            rnd = self._rounds.get(tg_user_id)
+            if rnd is None or rnd.offset != user.search_offset:
+                active = [sl for sl in slices if sl not in exhausted]
+                # срез получает не меньше MIN_SLICE_PAGE, а вся страница — ~QUEUE_PAGE_SIZE:
+                # если срезов много, они обходятся за несколько страниц (один круг)
+                count = max(MIN_SLICE_PAGE, -(-QUEUE_PAGE_SIZE // max(len(active), 1)))
+                rnd = self._rounds[tg_user_id] = _SearchRound(user.search_offset, count, active)
+
+            batch = rnd.pending[:max(1, QUEUE_PAGE_SIZE // rnd.count)]
+            del rnd.pending[:len(batch)]
+
+            pages = await asyncio.gather(*(
+                self._search_slice(
+                    semaphore,
+                    access_token=user.vk_access_token,
+                    city_id=city_id,
+                    sex=user.filter_gender,
+                    search_slice=sl,
+                    count=rnd.count,
+                    offset=rnd.offset,
+                )
+                for sl in batch
+            ))
+
+            for sl, (items, total) in zip(batch, pages):
+                # VK отдаёт максимум SEARCH_RESULTS_CAP результатов на один поиск
+                if len(items) < rnd.count or rnd.offset + rnd.count >= min(total, SEARCH_RESULTS_CAP):
+                    exhausted.add(sl)
+            done = all(sl in exhausted for sl in slices)
+
+            # offset сдвигается, когда круг пройден: все срезы листаются синхронно
+            offset = rnd.offset
+            if not rnd.pending:
+                offset += rnd.count
+                self._rounds.pop(tg_user_id, None)
+
+            added = await self._append_candidates(tg_user_id, _merge_round_robin(pages))
+            await self.user_repo.set_search_state(tg_user_id, offset=offset, done=done)
+            user.search_offset = offset
+            logger.info(
+                'Очередь %d: +%d кандидатов из %d срезов (offset=%d, done=%s)',
+                tg_user_id, added, len(batch), offset, done,
+            )
+
+            if added or done:
+                return
+
+    async def _search_slice(
+            self,
+            semaphore: asyncio.Semaphore, *,
+            access_token: str,
+            city_id: int,
+            sex: int,
+            search_slice: SearchSlice,
+            count: int,
+            offset: int,
+    ) -> tuple[list[dict], int]:
+        """Страница одного среза: (items, count найденных VK)."""
+        async with semaphore:
+            data = await self.vk.users_search(
+                access_token=access_token,
+                city_id=city_id,
+                sex=sex,
+                age_from=search_slice.age_from,
+                age_to=search_slice.age_to,
+                birth_month=search_slice.birth_month,
+                count=count,
+                offset=offset,
+            )
+
+        response = data.get("response", {})
+        return response.get("items", []), int(response.get("count", 0))
+
+    async def _append_candidates(self, tg_user_id: int, items: list[dict]) -> int:
+        """
+        Сохраняет профили подходящих кандидатов страницы и дописывает их в очередь.
+        Закрытые, безфотые и кандидаты из негативного кэша отсеиваются здесь:
+        иначе на каждого ушёл бы photos.get при показе карточки, а потом автопропуск.
+        """
         vk_ids = []
+        profiles = []
+        skipped = 0
+        no_photos = await self.user_repo.get_no_photo_ids(
+            [int(it["id"]) for it in items if "id" in it]
+        )
 
         for it in items:
             if "id" not in it:
                 continue
-            vk_id = int(it["id"])
-            vk_ids.append(vk_id)
+            if not _is_usable_candidate(it) or int(it["id"]) in no_photos:
+                skipped += 1
+                continue
+            vk_ids.append(int(it["id"]))
+            profiles.append(profile_from_vk(it))
 
-            # сохраняем профиль кандидата в repo
-            profile = ProfileDTO(
-                vk_user_id=vk_id,
-                first_name=it.get("first_name", ""),
-                last_name=it.get("last_name", ""),
-                domain=it.get("domain", ""),
-            )
-            await self.user_repo.upsert_profile(profile)
+        # сохраняем профили кандидатов страницы одной операцией
+        await self.user_repo.upsert_profiles(profiles)
 
-        await self.user_repo.set_queue(tg_user_id, vk_ids)
+        if skipped:
+            logger.debug('Очередь %d: отсеяно %d закрытых/безфотых кандидатов', tg_user_id, skipped)
+        return await self.user_repo.append_queue(tg_user_id, vk_ids)
 
     async def get_candidate_card(self, tg_user_id: int) -> tuple[ProfileDTO | None, list]:
         """
@@ -106,6 +350,7 @@ class DatingService:
 
     async def next_candidate(self, tg_user_id: int) -> int | None:
         await self.ensure_queue(tg_user_id)
+        await self._ensure_ahead(tg_user_id)
         return await self.user_repo.move_next(tg_user_id)
 
     async def prev_candidate(self, tg_user_id: int) -> int | None:
@@ -116,7 +361,13 @@ class DatingService:
         """
         Подгружает фото для следующих PRELOAD_BUFFER кандидатов впереди курсора.
         Вызывать после next_candidate, чтобы буфер готовых анкет не иссякал.
+        VK-запросы предзагрузки идут по фоновой полосе лимитера и не
+        задерживают запросы самого пользователя.
         """
+        with background_priority():
+            await self._preload_ahead(tg_user_id)
+
+    async def _preload_ahead(self, tg_user_id: int) -> None:
         if self._photo_service is None:
             return
 
@@ -132,17 +383,69 @@ class DatingService:
         # берём до PRELOAD_BUFFER кандидатов впереди курсора
         ahead = q[cursor + 1: cursor + 1 + PRELOAD_BUFFER]
 
+        # если фото уже подготовлены, кандидат в негативном кэше или его
+        # профиль закрылся (по обновлению профилей) — пропускаем
+        no_photos = await self.user_repo.get_no_photo_ids(ahead)
+        pending = []
         for vk_id in ahead:
-            # если фото уже подготовлены — пропускаем
-            existing = await self.user_repo.get_photos(vk_id)
-            if existing:
+            if vk_id in no_photos:
                 continue
+            profile = await self.user_repo.get_profile(vk_id)
+            if profile is not None and profile.is_closed:
+                continue
+            existing = await self.user_repo.get_photos(vk_id)
+            if not existing:
+                pending.append(vk_id)
 
-            try:
-                await self._photo_service.fetch_and_save_photos(
-                    access_token=user.vk_access_token,
-                    vk_user_id=vk_id,
-                )
-                logger.info('Предзагрузка: фото кандидата %d готовы', vk_id)
-            except Exception:
-                logger.warning('Предзагрузка: ошибка для кандидата %d', vk_id, exc_info=True)
+        # кандидатов обрабатываем параллельно: их photos.get
+        # попадают в одно окно батчинга и уходят в VK одним execute
+        await asyncio.gather(*(
+            self._preload_one(user.vk_access_token, vk_id) for vk_id in pending
+        ))
+
+    async def _preload_one(self, access_token: str, vk_id: int) -> None:
+        """Подготовка фото одного кандидата в рамках preload_ahead."""
+        try:
+            await self._photo_service.fetch_and_save_photos(
+                access_token=access_token,
+                vk_user_id=vk_id,
+            )
+            logger.info('Предзагрузка: фото кандидата %d готовы', vk_id)
+        except Exception:
+            logger.warning('Предзагрузка: ошибка для кандидата %d', vk_id, exc_info=True)
+
+
+async def _wait_page(task: asyncio.Task) -> None:
+    """
+    Дождаться загрузки страницы. Если её отменила смена фильтров — это не ошибка
+    ожидающего: просто возвращаемся (отмену самого ожидающего пробрасываем).
+    """
+    try:
+        await task
+    except asyncio.CancelledError:
+        if not task.cancelled() or asyncio.current_task().cancelling():
+            raise
+
+
+def _is_usable_candidate(item: dict) -> bool:
+    """
+    Можно ли показать кандидата из users.search:
+    профиль не закрыт (или закрыт, но доступен) и в нём есть фото.
+    Отсутствующие в ответе поля не считаются причиной отсеять.
+    """
+    if item.get("is_closed") and not item.get("can_access_closed"):
+        return False
+    if item.get("has_photo") == 0:
+        return False
+    return True
+
+
+def _merge_round_robin(pages: list[tuple[list[dict], int]]) -> list[dict]:
+    """Сливает страницы срезов поочерёдно (по одному из каждого), чтобы возрасты перемешались."""
+    merged = []
+    longest = max((len(items) for items, _ in pages), default=0)
+    for i in range(longest):
+        for items, _ in pages:
+            if i < len(items):
+                merged.append(items[i])
+    return merged
@@ -1,75 +1,232 @@
 # фоновый воркер: скачивание + InsightFace пайплайн
 
 import asyncio
-import functools
+import contextvars
 import logging
-import aiohttp
-from pathlib import Path
+import time
 from dataclasses import dataclass, field
+from pathlib import Path
+
+import aiofiles
 
 from src.infrastructure.vk.methods import VkMethods
+from src.infrastructure.vk.photo_downloader import PhotoDownloader
+from src.infrastructure.vk.rate_limiter import current_priority, raise_priority
+from src.infrastructure.storage.photo_store import PhotoStore
+from src.infrastructure.storage.rendition import make_rendition
+from src.infrastructure.vision.executor import VisionExecutor
 from src.infrastructure.db.repositories import UserRepo, PhotoDTO
-from src.core.config import PHOTO_DIR, PHOTO_BATCH_SIZE, USE_INSIGHTFACE
+from src.core.config import (
+    PHOTO_BATCH_SIZE, PHOTO_ANALYZE_IN_MEMORY, USE_INSIGHTFACE, NO_PHOTO_TTL_SEC, NO_PHOTO_RETRY_TTL_SEC,
+)
+from src.core.exceptions import VkApiError
 
 _HAS_INSIGHTFACE = False
 if USE_INSIGHTFACE:
     try:
-        from src.infrastructure.vision.detector import FaceDetector
-        from src.infrastructure.vision.photo_selector import select_top_photos
+        from src.infrastructure.vision.detector import FaceDetector  # noqa: F401 — проверка, что insightface установлен
         _HAS_INSIGHTFACE = True
     except ImportError:
         pass
 
 logger = logging.getLogger(__name__)
 
+# причины попадания кандидата в негативный кэш (repo.mark_no_photos)
+NO_PHOTO_DELETED = 'deleted'                  # страница удалена или заблокирована
+NO_PHOTO_EMPTY = 'no_photos'                  # в профиле нет фото
+NO_PHOTO_DOWNLOAD_FAILED = 'download_failed'  # ни одно фото не скачалось
+
+# размеры VK для анализа в порядке предпочтения: y (807px), x (604px), затем
+# крупнее (z, w), затем мельче — по убыванию (r 510px ... s 75px)
+ANALYSIS_SIZE_PRIORITY = ('y', 'x', 'z', 'w', 'r', 'q', 'p', 'o', 'm', 's')
+# размеры VK для показа: от самого большого к самому маленькому
+DISPLAY_SIZE_PRIORITY = ('w', 'z', 'y', 'x', 'r', 'q', 'p', 'o', 'm', 's')
+
+# ошибки VK photos.get, после которых фото кандидата не получить никому
+# (18 — страница удалена/заблокирована). 30 (приватный профиль) и 200 (нет доступа
+# к альбому) зависят от того, чей токен: в общий негативный кэш они не идут
+NO_ACCESS_CODES = {18}
+
 
 @dataclass
 class PhotoProcessingService:
     vk: VkMethods
     user_repo: UserRepo
-    photos_dir: Path = PHOTO_DIR
     top_n: int = 3                       # сколько лучших фото отбирать
     download_n: int = PHOTO_BATCH_SIZE   # сколько фото скачивать для анализа InsightFace
-    _detector: object | None = field(default=None, repr=False)
-
-    async def _get_detector_async(self):
-        """Ленивая инициализация детектора в thread pool (модель загружается один раз)."""
-        if self._detector is None:
-            loop = asyncio.get_running_loop()
-            self._detector = await loop.run_in_executor(None, FaceDetector)
-        return self._detector
+    analyze_in_memory: bool = PHOTO_ANALYZE_IN_MEMORY   # на диск — только выбранные фото
+    downloader: PhotoDownloader = field(default_factory=PhotoDownloader)
+    # отдельный исполнитель InsightFace (пул процессов или потоков, см. VISION_WORKERS)
+    vision: VisionExecutor = field(default_factory=VisionExecutor)
+    # обработки в процессе: vk_user_id → (задача, её контекст) (single-flight)
+    _inflight: dict[int, tuple[asyncio.Task, contextvars.Context]] = field(default_factory=dict, repr=False)
+    # кандидаты, чьи вытесненные фото не докачались: vk_user_id → когда пробовать снова (monotonic)
+    _restore_retry_at: dict[int, float] = field(default_factory=dict, repr=False)
+
+    @property
+    def store(self) -> PhotoStore:
+        """Хранилище фото (local_path в PhotoDTO — ключ в нём)."""
+        return self.downloader.store
 
     async def warm_up_detector(self) -> None:
-        """Прогрев детектора при старте приложения."""
+        """Прогрев детектора (и запуск воркеров InsightFace) при старте приложения."""
         if not _HAS_INSIGHTFACE:
             return
-        await self._get_detector_async()
+        await self.vision.start()
         logger.info('FaceDetector прогрет и готов к работе')
 
     async def fetch_and_save_photos(self, access_token: str, vk_user_id: int) -> list[PhotoDTO]:
+        """
+        Обработка фото кандидата с дедупликацией по vk_user_id:
+        если для кандидата уже идёт обработка (предзагрузка или другой пользователь),
+        ждём её результат вместо повторного скачивания и прогона InsightFace.
+        Общая обработка идёт с приоритетом самого срочного ожидающего: если её
+        начала предзагрузка, а теперь ждёт пользователь — дальше её VK-вызовы
+        идут интерактивной полосой.
+        """
+        entry = self._inflight.get(vk_user_id)
+        if entry is None:
+            ctx = contextvars.copy_context()
+            task = asyncio.create_task(self._fetch_and_save_photos(access_token, vk_user_id), context=ctx)
+            self._inflight[vk_user_id] = task, ctx
+            task.add_done_callback(lambda t: self._forget_inflight(vk_user_id, t))
+        else:
+            task, ctx = entry
+            raise_priority(ctx, current_priority())
+            logger.info('Кандидат %d: обработка уже идёт, ждём её результат', vk_user_id)
+
+        # shield: отмена одного ожидающего не должна отменять общую обработку
+        return await asyncio.shield(task)
+
+    async def shown_photos(self, photos: list[PhotoDTO]) -> list[tuple[PhotoDTO, Path]]:
+        """Выбранные фото, которые есть чем показать, и файл для отправки каждого (диск — в потоке)."""
+        def _collect() -> list[tuple[PhotoDTO, Path]]:
+            shown = []
+            for photo in photos:
+                if photo.status != 'selected':
+                    continue
+                path = self._display_path(photo)
+                if path is not None:
+                    shown.append((photo, path))
+            return shown
+
+        return await asyncio.to_thread(_collect)
+
+    async def touch_shown(self, photos: list[PhotoDTO]) -> None:
+        """Отмечает показ фото — давно не показанные первыми вытесняются с диска."""
+        def _touch() -> None:
+            for photo in photos:
+                self.store.touch(photo.rendition_path or photo.local_path)
+
+        await asyncio.to_thread(_touch)
+
+    async def restore_missing(self, vk_user_id: int, photos: list[PhotoDTO]) -> list[PhotoDTO]:
+        """
+        Докачивает выбранные фото, которые нечем показать (файлы вытеснены
+        PhotoCacheManager или пропали), и пережимает для Telegram их и фото,
+        сохранённые до появления пережатых копий. Анализ не повторяется —
+        берётся сохранённый URL (для показа, если есть). Возвращает тот же список.
+        Если докачать не удалось, следующая попытка — не раньше чем через
+        NO_PHOTO_RETRY_TTL_SEC, а не на каждом показе карточки.
+        """
+        selected = [p for p in photos if p.status == 'selected']
+
+        def _check() -> tuple[list[PhotoDTO], list[PhotoDTO]]:
+            missing = [p for p in selected if self._display_path(p) is None]
+            unrendered = [p for p in selected if p.rendition_path is None and self.store.exists(p.local_path)]
+            return missing, unrendered
+
+        missing, unrendered = await asyncio.to_thread(_check)
+        missing = [p for p in missing if p.display_url or p.url]
+        retry_at = self._restore_retry_at.get(vk_user_id)
+        if retry_at is not None and retry_at > time.monotonic():
+            missing = []
+        if not missing and not unrendered:
+            return photos
+
+        keys = await asyncio.gather(*(
+            self.downloader.download(p.display_url or p.url, alt_url=p.url if p.display_url else None)
+            for p in missing
+        ))
+        restored = []
+        for photo, key in zip(missing, keys):
+            if key is not None:
+                photo.local_path = key
+                photo.rendition_path = None
+                restored.append(photo)
+
+        if len(restored) < len(missing):
+            self._back_off_restore(vk_user_id)
+        else:
+            self._restore_retry_at.pop(vk_user_id, None)
+        if missing:
+            logger.info('Кандидат %d: докачано %d из %d вытесненных фото', vk_user_id, len(restored), len(missing))
+
+        if not restored and not unrendered:
+            return photos
+        await self._make_renditions(restored + unrendered)
+        await self.user_repo.set_photos(vk_user_id, photos)
+        return photos
+
+    def _display_path(self, photo: PhotoDTO) -> Path | None:
+        """Файл для отправки в Telegram: пережатая копия, иначе оригинал (None — файла нет). Обращается к диску."""
+        for local_path in (photo.rendition_path, photo.local_path):
+            if self.store.exists(local_path):
+                return self.store.resolve(local_path)
+        return None
+
+    def _back_off_restore(self, vk_user_id: int) -> None:
+        """Откладывает докачку фото кандидата на NO_PHOTO_RETRY_TTL_SEC (истёкшие отметки удаляются)."""
+        now = time.monotonic()
+        self._restore_retry_at = {k: t for k, t in self._restore_retry_at.items() if t > now}
+        self._restore_retry_at[vk_user_id] = now + NO_PHOTO_RETRY_TTL_SEC
+
+    def _forget_inflight(self, vk_user_id: int, task: asyncio.Task) -> None:
+        """Снимает завершённую обработку с регистрации."""
+        entry = self._inflight.get(vk_user_id)
+        if entry is not None and entry[0] is task:
+            del self._inflight[vk_user_id]
+
+    async def _fetch_and_save_photos(self, access_token: str, vk_user_id: int) -> list[PhotoDTO]:
         """
         Полный пайплайн обработки фото кандидата:
 
+        0) Кандидат в негативном кэше → сразу пустой список
         1) photos.get из VK → список фото с лайками
-        2) Если 0 фото → вернуть пустой список (кандидат будет пропущен)
-        3) Сортировка по лайкам, скачивание top download_n на диск
+        2) Если 0 фото → в негативный кэш и пустой список (кандидат будет пропущен)
+        3) Сортировка по лайкам, скачивание top download_n в среднем
+           размере (x/y) — детектору больше не нужно; при analyze_in_memory
+           фото остаются в памяти и на диск не пишутся
         4) Если скачано < 3 фото → пропускаем InsightFace, используем как есть
         5) Если >= 3 → прогоняем через InsightFace пайплайн:
            detect → filter (1 лицо, score, size) → blur → embed →
            cosine similarity (один человек) → top-3 selected
-        6) Сохраняем результат в repo
+        6) Для выбранных фото докачиваем большой размер для показа (или сохраняем
+           из памяти размер для анализа), сохраняем результат в repo; у остальных
+           фото остаются только метаданные
         """
+        # кандидат уже в негативном кэше — не тратим запросы VK и CPU
+        if await self.user_repo.get_no_photo_ids([vk_user_id]):
+            logger.info('Кандидат %d: в негативном кэше, пропускаем', vk_user_id)
+            return []
+
         # 1) получаем фото из VK
-        data = await self.vk.photos_get(
-            access_token=access_token,
-            owner_id=vk_user_id,
-        )
+        try:
+            data = await self.vk.photos_get(
+                access_token=access_token,
+                owner_id=vk_user_id,
+            )
+        except VkApiError as e:
+            if e.code in NO_ACCESS_CODES:
+                await self.user_repo.mark_no_photos(vk_user_id, NO_PHOTO_DELETED, NO_PHOTO_TTL_SEC)
+            raise
 
         items = data.get("response", {}).get("items", [])
 
         # 2) если фото нет — кандидат без фото
         if not items:
             logger.info('Кандидат %d: нет фото в профиле', vk_user_id)
+            await self.user_repo.mark_no_photos(vk_user_id, NO_PHOTO_EMPTY, NO_PHOTO_TTL_SEC)
             return []
 
         # парсим и сортируем по лайкам
@@ -79,7 +236,8 @@ class PhotoProcessingService:
             owner_id = item.get("owner_id", vk_user_id)
             likes_count = item.get("likes", {}).get("count", 0)
 
-            url = self._get_best_url(item)
+            # для анализа — средний размер, для показа — самый большой
+            url = self._get_analysis_url(item)
             if not url:
                 continue
 
@@ -88,9 +246,15 @@ class PhotoProcessingService:
                 owner_id=owner_id,
                 url=url,
                 likes_count=likes_count,
+                display_url=self._get_best_url(item),
+                sizes={
+                    s["type"]: s["url"] for s in item.get("sizes", [])
+                    if s.get("type") and s.get("url")
+                },
             ))
 
         if not parsed:
+            await self.user_repo.mark_no_photos(vk_user_id, NO_PHOTO_EMPTY, NO_PHOTO_TTL_SEC)
             return []
 
         parsed.sort(key=lambda p: p.likes_count, reverse=True)
@@ -98,22 +262,17 @@ class PhotoProcessingService:
         # 3) скачиваем top download_n для анализа
         to_download = parsed[:self.download_n]
 
-        user_dir = self.photos_dir / str(vk_user_id)
-        user_dir.mkdir(parents=True, exist_ok=True)
-
-        timeout = aiohttp.ClientTimeout(total=15)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            tasks = [self._download_photo(photo, user_dir, session) for photo in to_download]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+        tasks = [self._download_photo(photo) for photo in to_download]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
 
-        downloaded = []
-        for photo, result in zip(to_download, results):
-            if isinstance(result, Exception) or result is None:
-                continue
-            photo.local_path = str(result)
-            downloaded.append(photo)
+        downloaded = [
+            photo for photo, ok in zip(to_download, results)
+            if ok is True
+        ]
 
         if not downloaded:
+            logger.info('Кандидат %d: не удалось скачать ни одного фото', vk_user_id)
+            await self.user_repo.mark_no_photos(vk_user_id, NO_PHOTO_DOWNLOAD_FAILED, NO_PHOTO_RETRY_TTL_SEC)
             return []
 
         # 4) если < 3 скачанных фото — пропускаем InsightFace, используем как есть
@@ -124,7 +283,7 @@ class PhotoProcessingService:
             )
             for photo in downloaded:
                 photo.status = 'selected'
-            await self.user_repo.set_photos(vk_user_id, downloaded)
+            await self._save_result(vk_user_id, downloaded, downloaded)
             return downloaded
 
         # 5) >= 3 фото — прогоняем через InsightFace пайплайн (если доступен)
@@ -133,15 +292,12 @@ class PhotoProcessingService:
             fallback = downloaded[:self.top_n]
             for photo in fallback:
                 photo.status = 'selected'
-            await self.user_repo.set_photos(vk_user_id, fallback)
+            await self._save_result(vk_user_id, fallback, fallback)
             return fallback
 
         logger.info('Кандидат %d: запуск InsightFace для %d фото', vk_user_id, len(downloaded))
-        detector = await self._get_detector_async()
-        loop = asyncio.get_running_loop()
-        selected = await loop.run_in_executor(
-            None,
-            functools.partial(select_top_photos, detector=detector, photos=downloaded, top_n=self.top_n),
+        selected = await self.vision.select_top_photos(
+            downloaded, top_n=self.top_n, resolve=self.store.resolve,
         )
 
         # если InsightFace не выбрал ни одного — fallback на top-3 по лайкам
@@ -150,13 +306,64 @@ class PhotoProcessingService:
             fallback = downloaded[:self.top_n]
             for photo in fallback:
                 photo.status = 'selected'
-            await self.user_repo.set_photos(vk_user_id, fallback)
+            await self._save_result(vk_user_id, fallback, fallback)
             return fallback
 
         # 6) сохраняем ВСЕ фото (rejected/accepted/selected) — для аналитики
-        await self.user_repo.set_photos(vk_user_id, downloaded)
+        await self._save_result(vk_user_id, selected, downloaded)
         return selected
 
+    async def _save_result(self, vk_user_id: int, selected: list[PhotoDTO], photos: list[PhotoDTO]) -> None:
+        """
+        Файлы — только для выбранных фото: большой размер для показа, а если
+        он не скачался — размер для анализа из памяти, плюс пережатая копия
+        для Telegram. Байты всех фото освобождаются, в repo сохраняются метаданные photos.
+        """
+        try:
+            await self._download_display(selected)
+            for photo in selected:
+                if photo.local_path is None and photo.content is not None:
+                    photo.local_path = await self.store.save(photo.content)
+        finally:
+            _release_content(photos)
+        await self._make_renditions(selected)
+        await self.user_repo.set_photos(vk_user_id, photos)
+
+    async def _make_renditions(self, photos: list[PhotoDTO]) -> None:
+        """
+        Пережимает фото для Telegram (см. make_rendition) — карточка уходит в Bot API
+        сотнями килобайт вместо мегабайт оригиналов. Если пережимать незачем,
+        rendition_path = local_path.
+        """
+        async def _one(photo: PhotoDTO) -> None:
+            path = self.store.resolve(photo.local_path)
+            if path is None:
+                return
+            try:
+                async with aiofiles.open(path, 'rb') as f:
+                    data = await f.read()
+            except OSError:
+                return
+
+            rendition = await asyncio.to_thread(make_rendition, data)
+            photo.rendition_path = (
+                await self.store.save(rendition) if rendition is not None else photo.local_path
+            )
+
+        await asyncio.gather(*(_one(p) for p in photos))
+
+    def _get_analysis_url(self, item: dict) -> str | None:
+        """
+        URL размера для анализа InsightFace: детектор работает на 640x640,
+        поэтому берём y (807px) или x (604px), а не w до 2560px.
+        Если их нет — ближайший из остальных (см. ANALYSIS_SIZE_PRIORITY).
+        """
+        by_type = {s.get("type"): s.get("url") for s in item.get("sizes", [])}
+        for size_type in ANALYSIS_SIZE_PRIORITY:
+            if by_type.get(size_type):
+                return by_type[size_type]
+        return self._get_best_url(item)
+
     def _get_best_url(self, item: dict) -> str | None:
         """Выбирает URL самого большого размера фото из sizes."""
         sizes = item.get("sizes", [])
@@ -164,26 +371,52 @@ class PhotoProcessingService:
             return None
 
         # VK sizes: s, m, x, o, p, q, r, y, z, w — w самый большой
-        priority = {'w': 9, 'z': 8, 'y': 7, 'x': 6, 'r': 5, 'q': 4, 'p': 3, 'o': 2, 'm': 1, 's': 0}
+        priority = {t: len(DISPLAY_SIZE_PRIORITY) - i for i, t in enumerate(DISPLAY_SIZE_PRIORITY)}
         best = max(sizes, key=lambda s: priority.get(s.get("type", ""), -1))
         return best.get("url")
 
-    async def _download_photo(self, photo: PhotoDTO, user_dir: Path, session: aiohttp.ClientSession) -> Path | None:
-        """Скачивает одно фото на диск."""
-        filename = f'{photo.photo_id}.jpg'
-        filepath = user_dir / filename
+    @staticmethod
+    def _get_alt_url(photo: PhotoDTO, url: str | None, order: tuple[str, ...]) -> str | None:
+        """Другой размер того же фото — следующий после url в порядке order (для hedged-запроса)."""
+        types = [t for t in order if photo.sizes.get(t)]
+        current = next((t for t in types if photo.sizes[t] == url), None)
+        if current is None:
+            return None
+        rest = types[types.index(current) + 1:]
+        return photo.sizes[rest[0]] if rest else None
+
+    async def _download_photo(self, photo: PhotoDTO) -> bool:
+        """
+        Скачивает размер фото для анализа: в память (photo.content) или
+        в хранилище (photo.local_path). Возвращает, удалось ли скачать.
+        """
+        alt_url = self._get_alt_url(photo, photo.url, ANALYSIS_SIZE_PRIORITY)
+        if self.analyze_in_memory:
+            photo.content = await self.downloader.fetch_bytes(photo.url, alt_url=alt_url)
+            return photo.content is not None
 
-        # если уже скачано — не качаем повторно
-        if filepath.exists():
-            return filepath
+        photo.local_path = await self.downloader.download(photo.url, alt_url=alt_url)
+        return photo.local_path is not None
 
-        try:
-            async with session.get(photo.url, ssl=False) as resp:
-                if resp.status != 200:
-                    return None
-                content = await resp.read()
-
-            filepath.write_bytes(content)
-            return filepath
-        except (aiohttp.ClientError, OSError):
-            return None
+    async def _download_display(self, photos: list[PhotoDTO]) -> None:
+        """
+        Докачивает большой размер только для выбранных фото (их увидит пользователь).
+        Если не скачался — остаётся размер для анализа.
+        """
+        pending = [p for p in photos if p.display_url and p.display_url != p.url]
+        results = await asyncio.gather(*(
+            self.downloader.download(
+                p.display_url,
+                alt_url=self._get_alt_url(p, p.display_url, DISPLAY_SIZE_PRIORITY),
+            )
+            for p in pending
+        ))
+        for photo, key in zip(pending, results):
+            if key is not None:
+                photo.local_path = key
+
+
+def _release_content(photos: list[PhotoDTO]) -> None:
+    """Освобождает байты фото после анализа (DTO живут дальше в repo и кэшах)."""
+    for photo in photos:
+        photo.content = None
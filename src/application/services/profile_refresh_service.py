@@ -0,0 +1,79 @@
+# обновление профилей кандидатов (имя, domain, is_closed) пачками users.get
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+from src.infrastructure.vk.methods import VkMethods
+from src.infrastructure.vk.rate_limiter import background_priority
+from src.infrastructure.db.repositories import UserRepo, ProfileDTO
+from src.core.config import PROFILE_REFRESH_INTERVAL_SEC
+
+logger = logging.getLogger(__name__)
+
+
+def profile_from_vk(item: dict) -> ProfileDTO:
+    """ProfileDTO из элемента ответа users.get / users.search."""
+    return ProfileDTO(
+        vk_user_id=int(item["id"]),
+        first_name=item.get("first_name", ""),
+        last_name=item.get("last_name", ""),
+        domain=item.get("domain", ""),
+        is_closed=bool(item.get("is_closed")) and not item.get("can_access_closed"),
+    )
+
+
+@dataclass
+class ProfileRefreshService:
+    """
+    Держит свежими профили избранного и очереди пользователя:
+    все id собираются в пачки users.get (до 1000 за вызов) и
+    сохраняются одним upsert_profiles, а не по запросу/сессии на профиль.
+    Для одного пользователя — не чаще раза в interval_sec; запускается при
+    листании очереди и открытии избранного. Закрывшиеся профили (is_closed)
+    пропускаются при показе и предзагрузке фото.
+    """
+    vk: VkMethods
+    user_repo: UserRepo
+    interval_sec: float = PROFILE_REFRESH_INTERVAL_SEC
+    _last_refresh: dict[int, float] = field(default_factory=dict, repr=False)
+    _running: dict[int, asyncio.Task] = field(default_factory=dict, repr=False)
+
+    def schedule(self, tg_user_id: int) -> None:
+        """Запускает обновление в фоне (по фоновой полосе лимитера), если оно назрело."""
+        if tg_user_id in self._running:
+            return
+        last = self._last_refresh.get(tg_user_id)
+        if last is not None and time.monotonic() - last < self.interval_sec:
+            return
+
+        with background_priority():
+            task = asyncio.create_task(self.refresh(tg_user_id))
+        self._running[tg_user_id] = task
+        task.add_done_callback(lambda t: self._on_done(tg_user_id, t))
+
+    def _on_done(self, tg_user_id: int, task: asyncio.Task) -> None:
+        self._running.pop(tg_user_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning('Профили %d: ошибка обновления: %r', tg_user_id, task.exception())
+
+    async def refresh(self, tg_user_id: int) -> int:
+        """Обновляет профили избранного и очереди (от курсора). Возвращает число обновлённых."""
+        user = await self.user_repo.get_or_create_user(tg_user_id)
+        if not user.vk_access_token:
+            return 0
+
+        favorites = await self.user_repo.list_favorites(tg_user_id)
+        queue = await self.user_repo.get_queue(tg_user_id)
+        vk_ids = list(dict.fromkeys(favorites + queue[user.history_cursor:]))
+        if not vk_ids:
+            return 0
+
+        items = await self.vk.users_get_many(access_token=user.vk_access_token, user_ids=vk_ids)
+        profiles = [profile_from_vk(it) for it in items if "id" in it]
+        await self.user_repo.upsert_profiles(profiles)
+
+        self._last_refresh[tg_user_id] = time.monotonic()
+        logger.info('Профили %d: обновлено %d из %d', tg_user_id, len(profiles), len(vk_ids))
+        return len(profiles)
@@ -9,12 +9,20 @@ load_dotenv()
 TG_TOKEN = os.getenv('TG_TOKEN')
 VK_API_VERSION = os.getenv('VK_API_VERSION')
 
+# Адрес VK API (можно направить на локальный фейк: intests/fake_vk_server.py)
+VK_API_BASE_URL: str = os.getenv('VK_API_BASE_URL', 'https://api.vk.com/method')
+
 # Режим распознавания лиц (True — InsightFace, False — отбор по лайкам)
 USE_INSIGHTFACE: bool = os.getenv('USE_INSIGHTFACE', 'true').lower() in ('true', '1', 'yes')
 
 # Модель InsightFace (buffalo_l по умолчанию)
 INSIGHTFACE_MODEL: str = os.getenv('INSIGHTFACE_MODEL', 'buffalo_l')
 
+# Исполнитель InsightFace: число процессов-воркеров (0 — пул потоков в процессе бота)
+# и сколько заданий отбора фото может одновременно ждать/выполняться (backpressure)
+VISION_WORKERS: int = int(os.getenv('VISION_WORKERS', '0'))
+VISION_QUEUE_MAX: int = int(os.getenv('VISION_QUEUE_MAX', '16'))
+
 # Путь для сохранения данных и результатов обработки - не пушится
 BASE_PATH: Path = Path(__file__).resolve().parents[2]
 DATA_PATH = BASE_PATH / 'data'
@@ -25,9 +33,91 @@ PHOTO_DIR: Path = Path(os.getenv('PHOTO_DIR', str(DATA_PATH / 'photos')))
 # Размер пачки скачивания фото для InsightFace анализа
 PHOTO_BATCH_SIZE: int = int(os.getenv('PHOTO_BATCH_SIZE', '10'))
 
+# Анализ фото в памяти: скачанные байты сразу декодируются для InsightFace,
+# на диск пишутся только выбранные (selected) фото; false — все фото через диск
+PHOTO_ANALYZE_IN_MEMORY: bool = os.getenv('PHOTO_ANALYZE_IN_MEMORY', 'true').lower() in ('true', '1', 'yes')
+
+# Скачивание фото с CDN VK: одновременных скачиваний на весь бот, соединений
+# на один хост CDN, максимальный размер файла (байт) и таймаут скачивания (сек)
+PHOTO_DOWNLOAD_CONCURRENCY: int = int(os.getenv('PHOTO_DOWNLOAD_CONCURRENCY', '32'))
+PHOTO_CONN_LIMIT_PER_HOST: int = int(os.getenv('PHOTO_CONN_LIMIT_PER_HOST', '8'))
+PHOTO_MAX_BYTES: int = int(os.getenv('PHOTO_MAX_BYTES', str(10 * 1024 * 1024)))
+PHOTO_DOWNLOAD_TIMEOUT_SEC: float = float(os.getenv('PHOTO_DOWNLOAD_TIMEOUT_SEC', '15'))
+
+# Hedged-скачивание фото: если фото не скачалось за этот перцентиль недавних
+# времён скачивания (0 — выключено), параллельно запрашивается другой размер;
+# нижняя граница задержки второго запроса (сек)
+PHOTO_HEDGE_PERCENTILE: float = float(os.getenv('PHOTO_HEDGE_PERCENTILE', '90'))
+PHOTO_HEDGE_MIN_DELAY_SEC: float = float(os.getenv('PHOTO_HEDGE_MIN_DELAY_SEC', '0.2'))
+
+# Рендишен выбранных фото для Telegram: JPEG с длинной стороной не больше
+# PHOTO_RENDITION_MAX_SIDE px и качеством PHOTO_RENDITION_QUALITY (0-100)
+PHOTO_RENDITION_MAX_SIDE: int = int(os.getenv('PHOTO_RENDITION_MAX_SIDE', '1280'))
+PHOTO_RENDITION_QUALITY: int = int(os.getenv('PHOTO_RENDITION_QUALITY', '85'))
+
+# Кэш фото на диске: бюджет в байтах (сверх него вытесняются давно не показанные),
+# период сборки мусора (сек) и возраст, моложе которого файлы не трогаем (сек)
+PHOTO_CACHE_MAX_BYTES: int = int(os.getenv('PHOTO_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+PHOTO_GC_INTERVAL_SEC: float = float(os.getenv('PHOTO_GC_INTERVAL_SEC', '3600'))
+PHOTO_GC_GRACE_SEC: float = float(os.getenv('PHOTO_GC_GRACE_SEC', '600'))
+
 # Сколько ready-кандидатов держать впереди курсора (предзагрузка)
 PHOTO_BUFFER_AHEAD: int = int(os.getenv('PHOTO_BUFFER_AHEAD', '5'))
 
+# Негативный кэш кандидатов без пригодных фото (сек): сколько не пытаться снова.
+# Удалённая страница / нет фото — надолго, не удалось скачать — ненадолго.
+# Закрытые профили сюда не попадают: доступность фото зависит от токена
+NO_PHOTO_TTL_SEC: int = int(os.getenv('NO_PHOTO_TTL_SEC', str(7 * 24 * 3600)))
+NO_PHOTO_RETRY_TTL_SEC: int = int(os.getenv('NO_PHOTO_RETRY_TTL_SEC', '1800'))
+
+# Пул HTTP-соединений VK API: лимит соединений на хост, TTL DNS-кэша и keep-alive (сек)
+VK_CONN_LIMIT_PER_HOST: int = int(os.getenv('VK_CONN_LIMIT_PER_HOST', '20'))
+VK_DNS_CACHE_TTL: int = int(os.getenv('VK_DNS_CACHE_TTL', '300'))
+VK_KEEPALIVE_TIMEOUT: float = float(os.getenv('VK_KEEPALIVE_TIMEOUT', '30'))
+
+# Склейка близких вызовов VK в один execute (до 25 методов) и окно ожидания пачки (сек)
+VK_EXECUTE_BATCHING: bool = os.getenv('VK_EXECUTE_BATCHING', 'true').lower() in ('true', '1', 'yes')
+VK_BATCH_WINDOW_SEC: float = float(os.getenv('VK_BATCH_WINDOW_SEC', '0.02'))
+
+# Лимит запросов VK на токен: скорость (запр/сек), ёмкость корзины и сколько
+# токенов корзины фоновые запросы (предзагрузка) оставляют интерактивным
+VK_RATE_LIMIT_PER_SEC: float = float(os.getenv('VK_RATE_LIMIT_PER_SEC', '3'))
+VK_RATE_BURST: float = float(os.getenv('VK_RATE_BURST', '3'))
+VK_BACKGROUND_RESERVE: float = float(os.getenv('VK_BACKGROUND_RESERVE', '1'))
+
+# Пул сервисных/донорских токенов VK (через запятую) для фоновых неперсональных
+# вызовов (photos.get при предзагрузке); пусто — всё идёт токеном пользователя.
+# Токен, отвергнутый VK (error 5), выводится из пула на VK_TOKEN_POOL_COOLDOWN_SEC
+VK_SERVICE_TOKENS: list[str] = [t.strip() for t in os.getenv('VK_SERVICE_TOKENS', '').split(',') if t.strip()]
+VK_TOKEN_POOL_COOLDOWN_SEC: float = float(os.getenv('VK_TOKEN_POOL_COOLDOWN_SEC', '600'))
+
+# Circuit breaker методов VK: сбоев подряд до размыкания и пауза до пробного запроса (сек)
+VK_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv('VK_BREAKER_FAILURE_THRESHOLD', '5'))
+VK_BREAKER_RESET_SEC: float = float(os.getenv('VK_BREAKER_RESET_SEC', '30'))
+
+# Кэш ответов VK (database.getCities, photos.get): включение,
+# размер LRU (записей) и TTL по методам (сек)
+VK_RESPONSE_CACHE: bool = os.getenv('VK_RESPONSE_CACHE', 'false').lower() in ('true', '1', 'yes')
+VK_CACHE_MAX_ENTRIES: int = int(os.getenv('VK_CACHE_MAX_ENTRIES', '5000'))
+VK_CACHE_TTL_CITIES: float = float(os.getenv('VK_CACHE_TTL_CITIES', '86400'))
+VK_CACHE_TTL_PHOTOS: float = float(os.getenv('VK_CACHE_TTL_PHOTOS', '900'))
+
+# Очередь кандидатов: размер страницы users.search и сколько кандидатов должно
+# оставаться впереди курсора, прежде чем фоном догружается следующая страница
+QUEUE_PAGE_SIZE: int = int(os.getenv('QUEUE_PAGE_SIZE', '50'))
+QUEUE_REFILL_THRESHOLD: int = int(os.getenv('QUEUE_REFILL_THRESHOLD', '10'))
+
+# Поиск срезами: users.search отдаёт не больше 1000 результатов на запрос, поэтому
+# диапазон возрастов делится на срезы по одному возрасту (узкий диапазон — ещё и
+# по месяцу рождения), которые запрашиваются параллельно; SEARCH_CONCURRENCY=0 —
+# параллельность по бюджету лимитера VK (и по 25 вызовов на execute при батчинге)
+SEARCH_SLICING: bool = os.getenv('SEARCH_SLICING', 'true').lower() in ('true', '1', 'yes')
+SEARCH_CONCURRENCY: int = int(os.getenv('SEARCH_CONCURRENCY', '0'))
+SEARCH_MONTH_SLICE_MAX_AGES: int = int(os.getenv('SEARCH_MONTH_SLICE_MAX_AGES', '2'))
+
+# Как часто (сек) обновлять профили избранного и очереди пользователя пачками users.get
+PROFILE_REFRESH_INTERVAL_SEC: float = float(os.getenv('PROFILE_REFRESH_INTERVAL_SEC', '3600'))
+
 # Очистка БД при старте (true — очистить все таблицы, false — не трогать)
 CLEAN_DB_ON_START: bool = os.getenv('CLEAN_DB_ON_START', 'false').lower() in ('true', '1', 'yes')
 
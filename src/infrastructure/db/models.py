@@ -1,4 +1,6 @@
-from sqlalchemy import BigInteger, Integer, String, ForeignKey, UniqueConstraint
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Boolean, DateTime, Integer, String, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -24,6 +26,10 @@ class User(Base):
 
     history_cursor: Mapped[int] = mapped_column(Integer, default=0)
 
+    # пагинация users.search: offset следующей страницы и признак исчерпания
+    search_offset: Mapped[int] = mapped_column(Integer, default=0)
+    search_done: Mapped[bool] = mapped_column(Boolean, default=False)
+
 
 # ================= QUEUE =================
 
@@ -76,6 +82,7 @@ class Profile(Base):
     first_name: Mapped[str] = mapped_column(String, default='')
     last_name: Mapped[str] = mapped_column(String, default='')
     domain: Mapped[str] = mapped_column(String, default='')
+    is_closed: Mapped[bool] = mapped_column(Boolean, default=False)
 
 
 # ================= PHOTOS =================
@@ -92,8 +99,21 @@ class Photo(Base):
     photo_id: Mapped[int] = mapped_column(BigInteger)
     owner_id: Mapped[int] = mapped_column(BigInteger)
     url: Mapped[str] = mapped_column(String)
+    display_url: Mapped[str | None] = mapped_column(String, nullable=True)
     likes_count: Mapped[int] = mapped_column(Integer, default=0)
 
     local_path: Mapped[str | None] = mapped_column(String, nullable=True)
+    rendition_path: Mapped[str | None] = mapped_column(String, nullable=True)
     status: Mapped[str] = mapped_column(String(16), default='raw')
     reject_reason: Mapped[str | None] = mapped_column(String(32), nullable=True)
+
+
+# ================= NO-PHOTO CACHE =================
+
+class NoPhotoCandidate(Base):
+    """Негативный кэш: кандидат без пригодных фото (не скачиваем и не анализируем до expires_at)."""
+    __tablename__ = "no_photo_candidates"
+
+    vk_user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    reason: Mapped[str] = mapped_column(String(32))
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
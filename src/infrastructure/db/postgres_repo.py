@@ -1,11 +1,15 @@
+from datetime import datetime, timedelta, timezone
+
 from sqlalchemy import select, delete, update, func
 from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 
 from src.infrastructure.db.models import (
-    User, Profile, Photo, FavoriteProfile, Blacklist, QueueItem,
+    User, Profile, Photo, FavoriteProfile, Blacklist, QueueItem, NoPhotoCandidate,
 )
 from src.infrastructure.db.repositories import UserDTO, ProfileDTO, PhotoDTO
 
+IN_CHUNK_SIZE = 1000  # значений в одном IN (...) при массовых обновлениях
+
 
 class PostgresUserRepo:
     """
@@ -27,7 +31,7 @@ class PostgresUserRepo:
             user = result.scalar_one_or_none()
 
             if not user:
-                user = User(tg_user_id=tg_user_id, history_cursor=0)
+                user = User(tg_user_id=tg_user_id, history_cursor=0, search_offset=0, search_done=False)
                 s.add(user)
                 await s.commit()
                 await s.refresh(user)
@@ -61,6 +65,8 @@ class PostgresUserRepo:
             user.filter_age_from = age_from
             user.filter_age_to = age_to
             user.history_cursor = 0
+            user.search_offset = 0
+            user.search_done = False
 
             # сбрасываем очередь при смене фильтров
             await s.execute(
@@ -211,6 +217,45 @@ class PostgresUserRepo:
             )
             return list(result.scalars())
 
+    async def append_queue(self, tg_user_id: int, vk_ids: list[int]) -> int:
+        async with self._sf() as s:
+            await self._get_or_create_model(s, tg_user_id)
+
+            # уже стоящие в очереди кандидаты и последняя позиция
+            existing_result = await s.execute(
+                select(QueueItem.vk_profile_id).where(QueueItem.tg_user_id == tg_user_id)
+            )
+            seen = set(existing_result.scalars())
+
+            max_pos_result = await s.execute(
+                select(func.max(QueueItem.position)).where(QueueItem.tg_user_id == tg_user_id)
+            )
+            max_pos = max_pos_result.scalar()
+            pos = 0 if max_pos is None else max_pos + 1
+
+            added = 0
+            for vk_id in vk_ids:
+                if vk_id in seen:
+                    continue
+                seen.add(vk_id)
+                s.add(QueueItem(
+                    tg_user_id=tg_user_id,
+                    vk_profile_id=vk_id,
+                    position=pos,
+                ))
+                pos += 1
+                added += 1
+
+            await s.commit()
+            return added
+
+    async def set_search_state(self, tg_user_id: int, offset: int, done: bool) -> None:
+        async with self._sf() as s:
+            user = await self._get_or_create_model(s, tg_user_id)
+            user.search_offset = offset
+            user.search_done = done
+            await s.commit()
+
     async def get_current_vk_id(self, tg_user_id: int) -> int | None:
         async with self._sf() as s:
             # получаем курсор
@@ -291,12 +336,44 @@ class PostgresUserRepo:
                     first_name=profile.first_name,
                     last_name=profile.last_name,
                     domain=profile.domain,
+                    is_closed=profile.is_closed,
                 )
                 s.add(model)
             else:
                 model.first_name = profile.first_name
                 model.last_name = profile.last_name
                 model.domain = profile.domain
+                model.is_closed = profile.is_closed
+
+            await s.commit()
+
+    async def upsert_profiles(self, profiles: list[ProfileDTO]) -> None:
+        if not profiles:
+            return
+
+        async with self._sf() as s:
+            # все существующие профили пачки — одним запросом
+            by_id = {p.vk_user_id: p for p in profiles}
+            result = await s.execute(
+                select(Profile).where(Profile.vk_user_id.in_(by_id))
+            )
+            existing = {m.vk_user_id: m for m in result.scalars()}
+
+            for vk_user_id, profile in by_id.items():
+                model = existing.get(vk_user_id)
+                if model is None:
+                    s.add(Profile(
+                        vk_user_id=vk_user_id,
+                        first_name=profile.first_name,
+                        last_name=profile.last_name,
+                        domain=profile.domain,
+                        is_closed=profile.is_closed,
+                    ))
+                else:
+                    model.first_name = profile.first_name
+                    model.last_name = profile.last_name
+                    model.domain = profile.domain
+                    model.is_closed = profile.is_closed
 
             await s.commit()
 
@@ -315,6 +392,7 @@ class PostgresUserRepo:
                 first_name=model.first_name,
                 last_name=model.last_name,
                 domain=model.domain,
+                is_closed=bool(model.is_closed),
             )
 
     async def set_photos(self, vk_user_id: int, photos: list[PhotoDTO]) -> None:
@@ -330,8 +408,10 @@ class PostgresUserRepo:
                     photo_id=p.photo_id,
                     owner_id=p.owner_id,
                     url=p.url,
+                    display_url=p.display_url,
                     likes_count=p.likes_count,
                     local_path=p.local_path,
+                    rendition_path=p.rendition_path,
                     status=p.status,
                     reject_reason=p.reject_reason,
                 ))
@@ -349,14 +429,79 @@ class PostgresUserRepo:
                     photo_id=m.photo_id,
                     owner_id=m.owner_id,
                     url=m.url,
+                    display_url=m.display_url,
                     likes_count=m.likes_count,
                     local_path=m.local_path,
+                    rendition_path=m.rendition_path,
                     status=m.status,
                     reject_reason=m.reject_reason,
                 )
                 for m in result.scalars()
             ]
 
+    async def get_selected_photo_keys(self) -> set[str]:
+        async with self._sf() as s:
+            result = await s.execute(
+                select(Photo.local_path, Photo.rendition_path).where(
+                    Photo.status == 'selected',
+                )
+            )
+            return {key for row in result for key in row if key}
+
+    async def clear_local_paths(self, local_paths: list[str]) -> None:
+        if not local_paths:
+            return
+
+        async with self._sf() as s:
+            # по IN_CHUNK_SIZE путей на запрос: у PostgreSQL лимит 65535 параметров
+            for i in range(0, len(local_paths), IN_CHUNK_SIZE):
+                chunk = local_paths[i:i + IN_CHUNK_SIZE]
+                await s.execute(
+                    update(Photo)
+                    .where(Photo.local_path.in_(chunk))
+                    .values(local_path=None)
+                )
+                await s.execute(
+                    update(Photo)
+                    .where(Photo.rendition_path.in_(chunk))
+                    .values(rendition_path=None)
+                )
+            await s.commit()
+
+    # ================= NO-PHOTO CACHE =================
+
+    async def mark_no_photos(self, vk_user_id: int, reason: str, ttl_sec: float) -> None:
+        async with self._sf() as s:
+            now = datetime.now(timezone.utc)
+            # попутно удаляем истёкшие записи (по индексу expires_at), иначе таблица только растёт
+            await s.execute(
+                delete(NoPhotoCandidate).where(NoPhotoCandidate.expires_at <= now)
+            )
+
+            expires_at = now + timedelta(seconds=ttl_sec)
+            model = await s.get(NoPhotoCandidate, vk_user_id)
+
+            if model is None:
+                s.add(NoPhotoCandidate(vk_user_id=vk_user_id, reason=reason, expires_at=expires_at))
+            else:
+                model.reason = reason
+                model.expires_at = expires_at
+
+            await s.commit()
+
+    async def get_no_photo_ids(self, vk_user_ids: list[int]) -> set[int]:
+        if not vk_user_ids:
+            return set()
+
+        async with self._sf() as s:
+            result = await s.execute(
+                select(NoPhotoCandidate.vk_user_id).where(
+                    NoPhotoCandidate.vk_user_id.in_(vk_user_ids),
+                    NoPhotoCandidate.expires_at > datetime.now(timezone.utc),
+                )
+            )
+            return set(result.scalars())
+
     # ================= HELPERS =================
 
     @staticmethod
@@ -367,7 +512,7 @@ class PostgresUserRepo:
         user = result.scalar_one_or_none()
 
         if user is None:
-            user = User(tg_user_id=tg_user_id, history_cursor=0)
+            user = User(tg_user_id=tg_user_id, history_cursor=0, search_offset=0, search_done=False)
             s.add(user)
             await s.flush()
 
@@ -385,4 +530,6 @@ class PostgresUserRepo:
             filter_age_from=user.filter_age_from,
             filter_age_to=user.filter_age_to,
             history_cursor=user.history_cursor,
+            search_offset=user.search_offset or 0,
+            search_done=bool(user.search_done),
         )
@@ -1,7 +1,8 @@
 # Заглушка для написания бота
 
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Protocol, Dict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 @dataclass
 class ProfileDTO: # данные кандидата VK
@@ -9,14 +10,21 @@ class ProfileDTO: # данные кандидата VK
     first_name: str = ''
     last_name: str = ''
     domain: str = ''
+    is_closed: bool = False  # профиль закрыт (по последним данным VK)
 
 @dataclass
 class PhotoDTO: # метаданные фото кандидата
     photo_id: int
     owner_id: int
-    url: str
+    url: str                            # размер для анализа (x/y, ~600-800px)
     likes_count: int = 0
     local_path: Optional[str] = None
+    display_url: Optional[str] = None   # самый большой размер — для показа пользователю
+    rendition_path: Optional[str] = None  # ключ пережатой для Telegram копии (≤1280px)
+    # URL по типу размера из photos.get (в БД не сохраняется) — запасные размеры для hedged-скачивания
+    sizes: Dict[str, str] = field(default_factory=dict, repr=False, compare=False)
+    # скачанные байты фото на время анализа в памяти (в БД не сохраняется, после анализа обнуляется)
+    content: Optional[bytes] = field(default=None, repr=False, compare=False)
     status: str = 'raw'  # raw/accepted/rejected/selected
     reject_reason: Optional[str] = None  # no_face/multi_face/blurry/small_face/low_score/error
 
@@ -31,6 +39,8 @@ class UserDTO: #dataclass с полями пользователя
     filter_age_from: Optional[int] = None
     filter_age_to: Optional[int] = None
     history_cursor: int = 0
+    search_offset: int = 0       # offset следующей страницы users.search
+    search_done: bool = False    # users.search исчерпан для текущих фильтров
 
 class UserRepo(Protocol): #методы для MVP
     async def get_or_create_user(self, tg_user_id: int) -> UserDTO:
@@ -57,7 +67,7 @@ class UserRepo(Protocol): #методы для MVP
             age_to: int,
             city_id: int | None = None
             ) -> None:
-        """создай если нет, затем запиши фильтры, и сбрось cursor=0"""
+        """создай если нет, затем запиши фильтры, и сбрось cursor=0 и состояние поиска"""
         ...
 
     async def get_cursor(self, tg_user_id: int) -> int:
@@ -95,6 +105,14 @@ class UserRepo(Protocol): #методы для MVP
         """Вернуть очередь кандидатов (может быть пустой)"""
         ...
 
+    async def append_queue(self, tg_user_id: int, vk_ids: list[int]) -> int:
+        """Дописать кандидатов в конец очереди (без дублей, курсор не трогаем). Вернуть сколько добавлено"""
+        ...
+
+    async def set_search_state(self, tg_user_id: int, offset: int, done: bool) -> None:
+        """Сохранить offset следующей страницы users.search и признак исчерпания"""
+        ...
+
     async def get_current_vk_id(self, tg_user_id: int) -> int | None:
         """VK_ID текущего кандидата по cursor"""
         ...
@@ -111,6 +129,10 @@ class UserRepo(Protocol): #методы для MVP
         """Сохранить/обновить профиль кандидата VK"""
         ...
 
+    async def upsert_profiles(self, profiles: list[ProfileDTO]) -> None:
+        """Сохранить/обновить пачку профилей кандидатов VK за одну операцию"""
+        ...
+
     async def get_profile(self, vk_user_id: int) -> ProfileDTO | None:
         """Получить профиль кандидата по VK ID"""
         ...
@@ -123,6 +145,22 @@ class UserRepo(Protocol): #методы для MVP
         """Получить список фото кандидата (может быть пустым)"""
         ...
 
+    async def get_selected_photo_keys(self) -> set[str]:
+        """local_path и rendition_path всех выбранных (selected) фото — файлы, которые нужно хранить"""
+        ...
+
+    async def clear_local_paths(self, local_paths: list[str]) -> None:
+        """Обнулить local_path / rendition_path у фото, чьи файлы удалены с диска (метаданные остаются)"""
+        ...
+
+    async def mark_no_photos(self, vk_user_id: int, reason: str, ttl_sec: float) -> None:
+        """Занести кандидата в негативный кэш (нет пригодных фото) с причиной на ttl_sec секунд; истёкшие записи удалить"""
+        ...
+
+    async def get_no_photo_ids(self, vk_user_ids: list[int]) -> set[int]:
+        """Из переданных VK ID вернуть тех, кто сейчас в негативном кэше (запись не истекла)"""
+        ...
+
 class InMemoryUserRepo: # заглушка для написания кодаа бота, чтобы сохранять данные в памяти вместо SQL
     def __init__(self):
         self._users: Dict[int, UserDTO] = {}
@@ -134,6 +172,8 @@ class InMemoryUserRepo: # заглушка для написания кодаа
         self._profiles: Dict[int, ProfileDTO] = {}  # vk_user_id -> ProfileDTO
         # фото кандидатов VK
         self._photos: Dict[int, list[PhotoDTO]] = {}  # vk_user_id -> [PhotoDTO, ...]
+        # негативный кэш кандидатов без пригодных фото
+        self._no_photos: Dict[int, tuple[str, datetime]] = {}  # vk_user_id -> (reason, expires_at)
 
     async def get_or_create_user(self, tg_user_id: int) -> UserDTO:
         """Найди пользователя и верни его
@@ -175,7 +215,7 @@ class InMemoryUserRepo: # заглушка для написания кодаа
             age_to: int,
             city_id: int | None = None
             ) -> None:
-        """создай если нет, затем запиши фильтры, и сбрось cursor=0"""
+        """создай если нет, затем запиши фильтры, и сбрось cursor=0 и состояние поиска"""
 
         # Ищем пользователя
         user = await self.get_or_create_user(tg_user_id)
@@ -188,6 +228,8 @@ class InMemoryUserRepo: # заглушка для написания кодаа
         user.filter_age_to = age_to
 
         user.history_cursor = 0
+        user.search_offset = 0
+        user.search_done = False
 
         # сбрасываем очередь при смене фильтров
         self._queue.pop(tg_user_id, None)
@@ -283,6 +325,27 @@ class InMemoryUserRepo: # заглушка для написания кодаа
         user = await self.get_or_create_user(tg_user_id)
         return self._queue.get(user.tg_user_id, [])
 
+    async def append_queue(self, tg_user_id: int, vk_ids: list[int]) -> int:
+        """Дописать кандидатов в конец очереди (без дублей, курсор не трогаем)"""
+        user = await self.get_or_create_user(tg_user_id)
+        q = self._queue.setdefault(user.tg_user_id, [])
+
+        seen = set(q)
+        added = 0
+        for vk_id in vk_ids:
+            if vk_id in seen:
+                continue
+            seen.add(vk_id)
+            q.append(vk_id)
+            added += 1
+        return added
+
+    async def set_search_state(self, tg_user_id: int, offset: int, done: bool) -> None:
+        """Сохранить offset следующей страницы users.search и признак исчерпания"""
+        user = await self.get_or_create_user(tg_user_id)
+        user.search_offset = offset
+        user.search_done = done
+
     async def get_current_vk_id(self, tg_user_id: int) -> int | None:
         """VK_ID текущего кандидата по cursor."""
         user = await self.get_or_create_user(tg_user_id)
@@ -318,6 +381,11 @@ class InMemoryUserRepo: # заглушка для написания кодаа
         """Сохранить/обновить профиль кандидата VK"""
         self._profiles[profile.vk_user_id] = profile
 
+    async def upsert_profiles(self, profiles: list[ProfileDTO]) -> None:
+        """Сохранить/обновить пачку профилей кандидатов VK"""
+        for profile in profiles:
+            self._profiles[profile.vk_user_id] = profile
+
     async def get_profile(self, vk_user_id: int) -> ProfileDTO | None:
         """Получить профиль кандидата по VK ID"""
         return self._profiles.get(vk_user_id)
@@ -328,4 +396,37 @@ class InMemoryUserRepo: # заглушка для написания кодаа
 
     async def get_photos(self, vk_user_id: int) -> list[PhotoDTO]:
         """Получить список фото кандидата (может быть пустым)"""
-        return self._photos.get(vk_user_id, [])
\ No newline at end of file
+        return self._photos.get(vk_user_id, [])
+
+    async def get_selected_photo_keys(self) -> set[str]:
+        """local_path и rendition_path всех выбранных (selected) фото"""
+        return {
+            key
+            for photos in self._photos.values() for p in photos
+            if p.status == 'selected'
+            for key in (p.local_path, p.rendition_path) if key
+        }
+
+    async def clear_local_paths(self, local_paths: list[str]) -> None:
+        """Обнулить local_path у фото, чьи файлы удалены с диска"""
+        removed = set(local_paths)
+        for photos in self._photos.values():
+            for p in photos:
+                if p.local_path in removed:
+                    p.local_path = None
+                if p.rendition_path in removed:
+                    p.rendition_path = None
+
+    async def mark_no_photos(self, vk_user_id: int, reason: str, ttl_sec: float) -> None:
+        """Занести кандидата в негативный кэш с причиной на ttl_sec секунд"""
+        now = datetime.now(timezone.utc)
+        self._no_photos = {k: v for k, v in self._no_photos.items() if v[1] > now}
+        self._no_photos[vk_user_id] = (reason, now + timedelta(seconds=ttl_sec))
+
+    async def get_no_photo_ids(self, vk_user_ids: list[int]) -> set[int]:
+        """Из переданных VK ID вернуть тех, кто сейчас в негативном кэше"""
+        now = datetime.now(timezone.utc)
+        return {
+            vk_id for vk_id in vk_user_ids
+            if vk_id in self._no_photos and self._no_photos[vk_id][1] > now
+        }
@@ -0,0 +1,151 @@
+# фоновая уборка папки фото: бюджет в байтах (LRU по последнему показу) + удаление мусора
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from src.core.config import PHOTO_CACHE_MAX_BYTES, PHOTO_GC_INTERVAL_SEC, PHOTO_GC_GRACE_SEC
+from src.infrastructure.db.repositories import UserRepo
+from src.infrastructure.storage.photo_store import PhotoStore
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _StoredFile:
+    path: Path
+    local_path: str   # значение PhotoDTO.local_path для этого файла
+    size: int
+    mtime: float      # время скачивания или последнего показа (PhotoStore.touch)
+
+
+@dataclass
+class PhotoCacheManager:
+    """
+    Раз в interval_sec убирает папку фото:
+
+    1) мусор — файлы, на которые не ссылается ни одно выбранное (selected) фото
+       в репозитории: отклонённые, невыбранные, кандидаты, выпавшие из очередей,
+       брошенные .part-файлы. Файлы моложе grace_sec не трогаем — их может
+       сейчас сохранять идущая обработка кандидата;
+    2) если оставшееся больше max_bytes — удаляет давно не показанные (LRU по mtime).
+
+    У фото, чьи файлы удалены, local_path обнуляется (метаданные остаются);
+    при следующем показе выбранные фото докачиваются (PhotoProcessingService.restore_missing).
+    Обход диска идёт в отдельном потоке, чтобы не блокировать event loop.
+    """
+    store: PhotoStore
+    user_repo: UserRepo
+    max_bytes: int = PHOTO_CACHE_MAX_BYTES
+    interval_sec: float = PHOTO_GC_INTERVAL_SEC
+    grace_sec: float = PHOTO_GC_GRACE_SEC
+    _task: asyncio.Task | None = field(default=None, repr=False)
+
+    async def start(self) -> None:
+        """Запускает периодическую уборку (вызывать при старте бота)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def close(self) -> None:
+        """Останавливает уборку (вызывать при остановке бота)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.warning('Уборка папки фото: ошибка', exc_info=True)
+            await asyncio.sleep(self.interval_sec)
+
+    async def run_once(self) -> dict[str, int]:
+        """Один проход уборки. Возвращает статистику для логов."""
+        referenced = await self.user_repo.get_selected_photo_keys()
+        removed, stats = await asyncio.to_thread(self._collect, referenced)
+
+        # исправляем ссылки на удалённые файлы — фото докачаются при показе
+        await self.user_repo.clear_local_paths(removed)
+
+        logger.info(
+            'Уборка папки фото: мусор %d, вытеснено %d, осталось %d файлов / %d байт',
+            stats['orphans'], stats['evicted'], stats['files'], stats['bytes'],
+        )
+        return stats
+
+    def _collect(self, referenced: set[str]) -> tuple[list[str], dict[str, int]]:
+        """Обход диска и удаление (в отдельном потоке). Возвращает удалённые local_path и статистику."""
+        now = time.time()
+        removed: list[str] = []
+        orphans = 0
+        kept: list[_StoredFile] = []
+
+        for f in self._scan():
+            if f.mtime > now - self.grace_sec:
+                kept.append(f)
+            elif f.path.parent == self.store.tmp_dir:
+                # брошенный недокачанный файл
+                self._remove(f)
+            elif f.local_path not in referenced:
+                if self._remove(f):
+                    removed.append(f.local_path)
+                    orphans += 1
+            else:
+                kept.append(f)
+
+        # бюджет: удаляем давно не показанные, пока не уложимся (свежие не трогаем)
+        total = sum(f.size for f in kept)
+        evicted = 0
+        if total > self.max_bytes:
+            for f in sorted(kept, key=lambda f: f.mtime):
+                if total <= self.max_bytes or f.mtime > now - self.grace_sec:
+                    break
+                if self._remove(f):
+                    removed.append(f.local_path)
+                    total -= f.size
+                    evicted += 1
+
+        stats = {'orphans': orphans, 'evicted': evicted, 'files': len(kept) - evicted, 'bytes': total}
+        return removed, stats
+
+    def _scan(self):
+        """Все файлы хранилища (включая старую раскладку <vk_user_id>/<photo_id>.jpg и .tmp)."""
+        stack = [self.store.root]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                path = Path(entry.path)
+                yield _StoredFile(
+                    path=path,
+                    local_path=self.store.local_path_of(path),
+                    size=st.st_size,
+                    mtime=st.st_mtime,
+                )
+
+    @staticmethod
+    def _remove(f: _StoredFile) -> bool:
+        try:
+            f.path.unlink()
+            return True
+        except FileNotFoundError:
+            return True
+        except OSError:
+            return False
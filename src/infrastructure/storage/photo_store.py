@@ -0,0 +1,110 @@
+# хранилище фото по содержимому: имя файла — sha256, файлы разложены по шардам
+
+import hashlib
+import os
+import re
+import uuid
+from pathlib import Path
+
+import aiofiles
+import aiofiles.os
+
+from src.core.config import PHOTO_DIR
+
+# ключ фото — sha256 содержимого в hex
+_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+
+SHARD_LEVELS = 2   # уровней вложенности: <root>/ab/cd/<key>.jpg
+SHARD_WIDTH = 2    # символов ключа на уровень (256 подкаталогов на уровне)
+
+
+class PhotoStore:
+    """
+    Content-addressed хранилище фото.
+
+    Файл лежит по пути <root>/<ab>/<cd>/<sha256>.jpg, где ab/cd — первые
+    символы хэша: каталоги остаются небольшими даже на миллионах файлов,
+    а одинаковые фото (репосты, одно фото у разных кандидатов) хранятся один раз.
+
+    В PhotoDTO.local_path хранится ключ (sha256), путь получается через resolve().
+    Старые значения local_path — пути к файлам — resolve() возвращает как есть.
+    """
+
+    def __init__(self, root: Path = PHOTO_DIR):
+        self.root = Path(root)
+        self.tmp_dir = self.root / '.tmp'
+
+    @staticmethod
+    def is_key(value: str | None) -> bool:
+        return bool(value) and _KEY_RE.match(value) is not None
+
+    def path_for(self, key: str) -> Path:
+        """Путь файла по ключу."""
+        shards = [key[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+        return self.root.joinpath(*shards, f'{key}.jpg')
+
+    def resolve(self, local_path: str | None) -> Path | None:
+        """Путь файла по значению PhotoDTO.local_path (ключ или старый путь)."""
+        if not local_path:
+            return None
+        if self.is_key(local_path):
+            return self.path_for(local_path)
+        return Path(local_path)
+
+    def exists(self, local_path: str | None) -> bool:
+        """Есть ли файл фото на диске."""
+        path = self.resolve(local_path)
+        return path is not None and path.exists()
+
+    def local_path_of(self, path: Path) -> str:
+        """Обратное к resolve(): значение local_path для файла хранилища."""
+        if self.is_key(path.stem) and self.path_for(path.stem) == path:
+            return path.stem
+        return str(path)
+
+    def touch(self, local_path: str | None) -> None:
+        """Отмечает показ фото (mtime = сейчас) — по нему PhotoCacheManager вытесняет давно не показанные."""
+        path = self.resolve(local_path)
+        if path is None:
+            return
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    async def new_temp_path(self) -> Path:
+        """Путь временного файла для скачивания (в том же разделе, что и хранилище)."""
+        await aiofiles.os.makedirs(self.tmp_dir, exist_ok=True)
+        return self.tmp_dir / f'{uuid.uuid4().hex}.part'
+
+    async def commit(self, tmp: Path, key: str) -> str:
+        """
+        Переносит скачанный временный файл в хранилище под ключом key.
+        Если такое содержимое уже есть — временный файл удаляется (дедупликация).
+        Возвращает ключ.
+        """
+        dest = self.path_for(key)
+        try:
+            # такое фото уже есть — освежаем mtime, иначе PhotoCacheManager
+            # вытеснит только что понадобившийся файл как давно не показанный
+            os.utime(dest)
+        except FileNotFoundError:
+            pass
+        else:
+            await aiofiles.os.remove(tmp)
+            return key
+
+        await aiofiles.os.makedirs(dest.parent, exist_ok=True)
+        await aiofiles.os.replace(tmp, dest)
+        return key
+
+    async def save(self, data: bytes) -> str:
+        """Сохраняет фото из памяти (через временный файл и commit). Возвращает ключ."""
+        tmp = await self.new_temp_path()
+        try:
+            async with aiofiles.open(tmp, 'wb') as f:
+                await f.write(data)
+            return await self.commit(tmp, hashlib.sha256(data).hexdigest())
+        finally:
+            if await aiofiles.os.path.exists(tmp):
+                await aiofiles.os.remove(tmp)
@@ -0,0 +1,47 @@
+# пережатие выбранных фото для отправки в Telegram (JPEG, длинная сторона ≤ max_side)
+
+try:
+    import cv2
+    import numpy as np
+    HAS_CV2 = True
+except ImportError:  # opencv ставится вместе с InsightFace (необязательная зависимость)
+    HAS_CV2 = False
+
+from src.core.config import PHOTO_RENDITION_MAX_SIDE, PHOTO_RENDITION_QUALITY
+
+
+def make_rendition(
+        data: bytes,
+        max_side: int = PHOTO_RENDITION_MAX_SIDE,
+        quality: int = PHOTO_RENDITION_QUALITY,
+) -> bytes | None:
+    """
+    JPEG для Telegram: уменьшает фото до max_side по длинной стороне
+    и пережимает с качеством quality.
+
+    Возвращает None, если пережимать незачем или нечем: фото уже не больше
+    max_side и копия вышла бы не меньше оригинала, не удалось декодировать
+    или нет opencv — тогда отправляется оригинал.
+    """
+    if not HAS_CV2:
+        return None
+
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+
+    ok, buf = cv2.imencode('.jpg', img, [
+        cv2.IMWRITE_JPEG_QUALITY, quality,
+        cv2.IMWRITE_JPEG_OPTIMIZE, 1,
+    ])
+    if not ok:
+        return None
+
+    if scale >= 1 and len(buf) >= len(data):
+        return None
+    return buf.tobytes()
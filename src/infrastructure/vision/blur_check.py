@@ -3,20 +3,23 @@
 import cv2
 import numpy as np
 
+from src.infrastructure.vision.image_io import ImageInput, load_image
+
 
 # порог: ниже этого значения фото считается размытым
 MIN_BLUR_SCORE = 50.0
 
 
-def calc_blur_score(image_path: str, bbox: np.ndarray) -> float:
+def calc_blur_score(image: ImageInput, bbox: np.ndarray) -> float:
     """
     Оценка резкости кропа лица через variance of Laplacian.
     Чем выше значение — тем резче изображение.
 
-    image_path: путь к изображению
+    image: путь, байты или BGR-массив (см. load_image) — массив, уже
+           декодированный для детектора, не декодируется повторно
     bbox: [x1, y1, x2, y2] — координаты лица
     """
-    img = cv2.imread(image_path)
+    img = load_image(image)
     if img is None:
         return 0.0
 
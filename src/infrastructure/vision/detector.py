@@ -1,13 +1,16 @@
-# SCRFD: detect(image_path) → list[DetectedFace]
+# SCRFD: detect / detect_many(изображения) → list[DetectedFace]; ArcFace: embed_batch(выровненные лица) — только для прошедших фильтры
 
 import logging
-import cv2
 import numpy as np
+import onnxruntime
 from dataclasses import dataclass, field
 from pathlib import Path
-from insightface.app import FaceAnalysis
+from insightface.model_zoo.model_zoo import ModelRouter
+from insightface.utils import ensure_available, face_align
 
 from src.core.config import DATA_PATH, INSIGHTFACE_MODEL
+from src.infrastructure.vision.image_io import ImageInput, load_image
+from src.infrastructure.vision.scrfd_batch import detect_batch
 
 logger = logging.getLogger(__name__)
 
@@ -15,14 +18,23 @@ logger = logging.getLogger(__name__)
 MIN_DET_SCORE = 0.5       # минимальная уверенность детектора
 MIN_FACE_SIZE = 50        # минимальный размер лица в пикселях (по стороне bbox)
 
+# модели buffalo_l, которые нужны селектору: SCRFD и ArcFace
+# (landmark_2d_106, landmark_3d_68 и genderage не загружаются)
+ALLOWED_MODULES = ['detection', 'recognition']
+
+# сколько лиц подавать в ArcFace одним session.run
+EMBED_BATCH_MAX = 32
+# сколько фото подавать в SCRFD одним session.run (10 фото кандидата — 1-2 запуска)
+DETECT_BATCH_MAX = 8
+
 
 @dataclass
 class DetectedFace:
     """Результат детекции одного лица на фото."""
     bbox: np.ndarray           # [x1, y1, x2, y2]
     det_score: float
-    landmark: np.ndarray       # 5 точек
-    embedding: np.ndarray      # 512-d ArcFace (L2-нормирован)
+    landmark: np.ndarray       # 5 точек (kps SCRFD) — для выравнивания под ArcFace
+    embedding: np.ndarray | None = None   # 512-d ArcFace (L2-нормирован), после FaceDetector.embed
 
     @property
     def face_width(self) -> float:
@@ -35,43 +47,100 @@ class DetectedFace:
 
 class FaceDetector:
     """
-    Обёртка над InsightFace FaceAnalysis (SCRFD + ArcFace).
+    Обёртка над моделями InsightFace (SCRFD + ArcFace).
     Загружает модель buffalo_l один раз, переиспользует для всех фото.
+
+    Детекция и эмбеддинг разделены: detect() / detect_many() запускают только SCRFD,
+    align() + embed_batch() — ArcFace. Фильтры и blur-check идут между ними,
+    поэтому ArcFace не тратится на лица с отклонённых фото (а таких большинство),
+    а прошедшие лица всех фото кандидата считаются одним запуском модели.
     """
 
-    def __init__(self, models_dir: Path | None = None, det_size: tuple[int, int] = (640, 640)):
-        root = str(models_dir or DATA_PATH / 'models')
-        self._app = FaceAnalysis(
-            name=INSIGHTFACE_MODEL,
-            root=root,
-            providers=['CPUExecutionProvider'],
-        )
-        self._app.prepare(ctx_id=0, det_size=det_size)
+    def __init__(
+            self,
+            models_dir: Path | None = None,
+            det_size: tuple[int, int] = (640, 640),
+            num_threads: int = 0,
+    ):
+        """
+        num_threads — потоков ONNX Runtime на сессию (0 — по умолчанию ORT, по числу ядер).
+        VisionExecutor задаёт его так, чтобы воркеры × потоки сессии не превышали
+        число ядер; в пуле процессов — 1 (пул потоков ORT, созданный до fork,
+        в дочерних процессах не работает).
+        """
+        models = _load_models(str(models_dir or DATA_PATH / 'models'), num_threads)
+        self._det_model = models['detection']
+        self._rec_model = models['recognition']
+        self._det_model.prepare(0, input_size=det_size, det_thresh=0.5)
+        self._rec_model.prepare(0)
+        # модель с фиксированным batch=1 в графе пачку не примет
+        batch_dim = self._rec_model.input_shape[0]
+        self._embed_batch_max = 1 if batch_dim == 1 else EMBED_BATCH_MAX
+        # SCRFD с batch-выходами ([N, K, C]) и не фиксированным batch=1 — пачка фото за один запуск
+        self._det_batched = self._det_model.batched and self._det_model.input_shape[0] != 1
         logger.info('FaceDetector инициализирован (%s, CPU)', INSIGHTFACE_MODEL)
 
-    def detect(self, image_path: str) -> list[DetectedFace]:
+    def detect(self, image: ImageInput) -> list[DetectedFace]:
         """
-        Детектирует лица на изображении.
-        Возвращает список DetectedFace с bbox, score, landmark, embedding.
+        Детектирует лица на изображении (только SCRFD, без эмбеддингов).
+        image — путь, байты или BGR-массив (см. load_image); чтобы не декодировать
+        фото повторно для blur-check и embed, передавайте уже декодированный массив.
+        Возвращает список DetectedFace с bbox, score, landmark; embedding — через embed_batch().
         """
-        img = cv2.imread(image_path)
+        img = load_image(image)
         if img is None:
-            logger.warning('Не удалось прочитать изображение: %s', image_path)
+            logger.warning(
+                'Не удалось прочитать изображение: %s',
+                image if isinstance(image, (str, Path)) else type(image).__name__,
+            )
             return []
 
-        faces = self._app.get(img)
+        bboxes, kpss = self._det_model.detect(img, max_num=0, metric='default')
+        return _to_faces(bboxes, kpss)
 
-        result = []
-        for f in faces:
-            result.append(DetectedFace(
-                bbox=f.bbox,
-                det_score=float(f.det_score),
-                landmark=f.landmark,
-                embedding=f.normed_embedding,
-            ))
+    def detect_many(self, images: list[np.ndarray]) -> list[list[DetectedFace]]:
+        """
+        Детекция на нескольких декодированных изображениях: фото вписываются
+        (letterbox) в det_size и идут в SCRFD одним тензором — один запуск
+        на DETECT_BATCH_MAX фото. Если модель экспортирована без batch-измерения,
+        фото обрабатываются по одному. Результат — по списку лиц на каждое фото.
+        """
+        if not self._det_batched or len(images) < 2:
+            return [self.detect(img) for img in images]
 
+        result = []
+        for start in range(0, len(images), DETECT_BATCH_MAX):
+            for bboxes, kpss in detect_batch(self._det_model, images[start:start + DETECT_BATCH_MAX]):
+                result.append(_to_faces(bboxes, kpss))
         return result
 
+    def align(self, image: np.ndarray, face: DetectedFace) -> np.ndarray:
+        """
+        Выравнивание лица по 5 точкам в кроп 112x112 для ArcFace.
+        image — тот же декодированный массив, что передавался в detect();
+        после выравнивания полное изображение держать не нужно.
+        """
+        return face_align.norm_crop(image, landmark=face.landmark, image_size=self._rec_model.input_size[0])
+
+    def embed_batch(self, faces: list[DetectedFace], aligned: list[np.ndarray]) -> list[np.ndarray]:
+        """
+        ArcFace-эмбеддинги пачки лиц (можно с разных фото и разных кандидатов):
+        выровненные кропы (align) складываются в один тензор, модель запускается
+        один раз на каждые EMBED_BATCH_MAX лиц. Эмбеддинги L2-нормируются
+        и сохраняются в face.embedding.
+        """
+        step = self._embed_batch_max
+        for start in range(0, len(faces), step):
+            feats = self._rec_model.get_feat(aligned[start:start + step])
+            feats = feats / np.linalg.norm(feats, axis=1, keepdims=True)
+            for face, feat in zip(faces[start:start + step], feats):
+                face.embedding = feat
+        return [face.embedding for face in faces]
+
+    def embed(self, image: np.ndarray, face: DetectedFace) -> np.ndarray:
+        """ArcFace-эмбеддинг одного лица (пачка из одного — см. embed_batch)."""
+        return self.embed_batch([face], [self.align(image, face)])[0]
+
     def filter_single_face(self, faces: list[DetectedFace]) -> DetectedFace | None:
         """
         Фильтрация:
@@ -92,3 +161,38 @@ class FaceDetector:
             return None
 
         return face
+
+
+def _to_faces(bboxes: np.ndarray, kpss: np.ndarray | None) -> list[DetectedFace]:
+    """Выход SCRFD (det [n, 5], kpss [n, 5, 2]) → список DetectedFace без эмбеддингов."""
+    return [
+        DetectedFace(
+            bbox=bboxes[i, 0:4],
+            det_score=float(bboxes[i, 4]),
+            landmark=kpss[i] if kpss is not None else None,
+        )
+        for i in range(bboxes.shape[0])
+    ]
+
+
+def _load_models(root: str, num_threads: int) -> dict:
+    """
+    Модели ALLOWED_MODULES из набора INSIGHTFACE_MODEL (как FaceAnalysis, но сессии
+    ONNX Runtime сразу создаются с нужными SessionOptions — FaceAnalysis их не
+    пробрасывает, и иначе каждую модель пришлось бы загружать второй раз).
+    """
+    opts = onnxruntime.SessionOptions()
+    opts.intra_op_num_threads = num_threads
+    opts.inter_op_num_threads = 1 if num_threads else 0
+    onnxruntime.set_default_logger_severity(3)
+
+    model_dir = Path(ensure_available('models', INSIGHTFACE_MODEL, root=root))
+    models = {}
+    for onnx_file in sorted(model_dir.glob('*.onnx')):
+        model = ModelRouter(str(onnx_file)).get_model(sess_options=opts, providers=['CPUExecutionProvider'])
+        if model is not None and model.taskname in ALLOWED_MODULES and model.taskname not in models:
+            models[model.taskname] = model
+    missing = set(ALLOWED_MODULES) - models.keys()
+    if missing:
+        raise RuntimeError(f'В {model_dir} нет моделей: {sorted(missing)}')
+    return models
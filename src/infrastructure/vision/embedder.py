@@ -7,7 +7,8 @@ from src.infrastructure.vision.detector import DetectedFace
 def get_embedding(face: DetectedFace) -> np.ndarray:
     """
     Извлечь 512-мерный эмбеддинг из DetectedFace.
-    Эмбеддинг уже вычислен FaceAnalysis и L2-нормирован.
+    Эмбеддинг вычислен FaceDetector.embed_batch (ArcFace по выровненному
+    лицу) и L2-нормирован; до embed_batch он None.
     """
     return face.embedding
 
@@ -0,0 +1,280 @@
+# отдельный исполнитель InsightFace: пул процессов (fork после загрузки моделей) или потоков
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Callable
+
+from src.core.config import VISION_WORKERS, VISION_QUEUE_MAX
+from src.infrastructure.db.repositories import PhotoDTO
+
+logger = logging.getLogger(__name__)
+
+# детектор процесса-воркера: задаётся в родителе до fork и наследуется дочерними
+# процессами (copy-on-write), поэтому модели не загружаются в каждом воркере заново
+_worker_detector = None
+
+
+@dataclass(frozen=True)
+class _JobPhoto:
+    """Фото в задании воркеру: байты — срез общей памяти, либо путь к файлу."""
+    photo_id: int
+    owner_id: int
+    likes_count: int
+    offset: int = 0
+    size: int = 0
+    path: str | None = None
+
+
+@dataclass(frozen=True)
+class _SelectJob:
+    shm_name: str | None
+    photos: list[_JobPhoto]
+    top_n: int
+
+
+@dataclass(frozen=True)
+class _SelectResult:
+    statuses: list[tuple[str, str | None]]   # (status, reject_reason) по фото задания
+    selected: list[int]                      # индексы выбранных фото, в порядке отбора
+
+
+@dataclass
+class VisionExecutor:
+    """
+    Исполнитель пайплайна select_top_photos, отдельный от default thread pool.
+
+    workers > 0 — пул процессов: модели загружаются один раз в родителе, затем
+    воркеры порождаются fork'ом и делят веса с родителем (copy-on-write).
+    start() нужно вызвать до остальных компонентов бота: тогда fork идёт из
+    процесса без открытых пулов соединений и фоновых задач. Сломанный пул
+    (воркер упал) пересоздаётся через forkserver/spawn — процесс к этому моменту
+    уже многопоточный, и новые воркеры загружают модели сами.
+    Сессии ONNX Runtime в этом режиме однопоточные — параллельность даёт число
+    процессов, а NumPy/cv2-обвязка не упирается в GIL. Сжатые байты фото
+    передаются воркеру через shared memory, обратно — только статусы.
+    Без fork (Windows) — откат на потоки.
+
+    workers = 0 — пул потоков в этом же процессе (без fork и shared memory),
+    по потоку на ядро; сессии ORT делят ядра между потоками пула.
+
+    queue_max — сколько заданий может одновременно ждать или выполняться;
+    остальные ждут слот в select_top_photos (backpressure для предзагрузки).
+    """
+    workers: int = VISION_WORKERS
+    queue_max: int = VISION_QUEUE_MAX
+    _detector: object | None = field(default=None, repr=False)
+    _pool: Executor | None = field(default=None, repr=False)
+    _slots: asyncio.Semaphore | None = field(default=None, repr=False)
+    _start_lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    @property
+    def uses_processes(self) -> bool:
+        return isinstance(self._pool, ProcessPoolExecutor)
+
+    async def start(self) -> None:
+        """Загружает модели и поднимает пул (вызывать при старте бота; повторный вызов — no-op)."""
+        async with self._start_lock:
+            if self._pool is not None:
+                return
+
+            from src.infrastructure.vision.detector import FaceDetector
+
+            use_processes = self.workers > 0 and 'fork' in multiprocessing.get_all_start_methods()
+            if self.workers > 0 and not use_processes:
+                logger.warning('fork недоступен на этой платформе — InsightFace в пуле потоков')
+
+            cpus = os.cpu_count() or 1
+            threads = self.workers or cpus
+            # воркеры × потоки сессии ORT ≤ ядер: иначе каждая сессия держит свой
+            # пул потоков на все ядра и задания пула вытесняют друг друга
+            num_threads = 1 if use_processes else max(1, cpus // threads)
+            self._detector = await asyncio.to_thread(FaceDetector, num_threads=num_threads)
+            self._slots = asyncio.Semaphore(max(1, self.queue_max))
+
+            if use_processes:
+                await self._start_processes()
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='vision')
+            logger.info(
+                'VisionExecutor: %s, очередь до %d заданий',
+                f'{self.workers} процессов' if self.uses_processes else 'пул потоков', self.queue_max,
+            )
+
+    async def _start_processes(self) -> None:
+        """Fork воркеров: с контекстом fork пул порождает их все при первом задании."""
+        global _worker_detector
+        _worker_detector = self._detector
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('fork'),
+        )
+        await asyncio.get_running_loop().run_in_executor(self._pool, _ping)
+
+    async def _respawn_processes(self) -> None:
+        """
+        Новый пул взамен сломанного — без fork: процесс бота уже многопоточный
+        (пулы соединений, фоновые задачи). Воркеры forkserver/spawn загружают
+        модели сами (_init_worker).
+        """
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(method),
+            initializer=_init_worker,
+        )
+        await asyncio.get_running_loop().run_in_executor(self._pool, _ping)
+
+    async def close(self) -> None:
+        """Останавливает пул (вызывать при остановке бота)."""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+    async def select_top_photos(
+            self,
+            photos: list[PhotoDTO],
+            top_n: int,
+            resolve: Callable[[str], Path],
+    ) -> list[PhotoDTO]:
+        """
+        select_top_photos в пуле исполнителя. Статусы и reject_reason
+        проставляются переданным PhotoDTO, возвращаются выбранные (как в оригинале).
+        """
+        await self.start()
+
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+
+            if not self.uses_processes:
+                from src.infrastructure.vision.photo_selector import select_top_photos
+                return await loop.run_in_executor(
+                    self._pool,
+                    functools.partial(
+                        select_top_photos,
+                        detector=self._detector, photos=photos, top_n=top_n, resolve=resolve,
+                    ),
+                )
+
+            pool = self._pool
+            job, shm = _pack_job(photos, top_n, resolve)
+            try:
+                result = await loop.run_in_executor(pool, _run_job, job)
+            except BrokenProcessPool:
+                # воркер упал (OOM и т.п.) — пул непригоден, поднимаем заново для следующих заданий
+                await self._restart_processes(pool)
+                raise
+            finally:
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+
+        for photo, (status, reason) in zip(photos, result.statuses):
+            photo.status = status
+            photo.reject_reason = reason
+        return [photos[i] for i in result.selected]
+
+    async def _restart_processes(self, broken: Executor) -> None:
+        """
+        Замена сломанного пула новым. Под _start_lock и только если broken всё ещё
+        текущий пул: задания, упавшие вместе с ним, перезапускают пул один раз,
+        а self._pool ни на миг не становится None (иначе start() поднял бы второй
+        детектор, а задание ушло бы в ветку потоков).
+        """
+        async with self._start_lock:
+            if self._pool is not broken:
+                return
+            logger.error('VisionExecutor: пул процессов сломан, перезапускаем')
+            broken.shutdown(wait=False, cancel_futures=True)
+            await self._respawn_processes()
+
+
+def _pack_job(
+        photos: list[PhotoDTO],
+        top_n: int,
+        resolve: Callable[[str], Path],
+) -> tuple[_SelectJob, shared_memory.SharedMemory | None]:
+    """
+    Задание воркеру: байты фото из памяти (content) — подряд в один блок shared
+    memory, фото на диске — путём к файлу (воркер прочитает сам).
+    """
+    total = sum(len(p.content) for p in photos if p.content is not None)
+    shm = shared_memory.SharedMemory(create=True, size=total) if total else None
+
+    items = []
+    offset = 0
+    for p in photos:
+        if p.content is not None:
+            size = len(p.content)
+            shm.buf[offset:offset + size] = p.content
+            items.append(_JobPhoto(p.photo_id, p.owner_id, p.likes_count, offset=offset, size=size))
+            offset += size
+        else:
+            path = resolve(p.local_path) if p.local_path else None
+            items.append(_JobPhoto(p.photo_id, p.owner_id, p.likes_count, path=str(path) if path else None))
+
+    return _SelectJob(shm_name=shm.name if shm else None, photos=items, top_n=top_n), shm
+
+
+def _ping() -> None:
+    """Пустое задание: заставляет пул породить воркеров сразу после загрузки моделей."""
+
+
+def _init_worker() -> None:
+    """Инициализация воркера forkserver/spawn: своя копия моделей, однопоточные сессии."""
+    global _worker_detector
+    from src.infrastructure.vision.detector import FaceDetector
+    _worker_detector = FaceDetector(num_threads=1)
+
+
+def _run_job(job: _SelectJob) -> _SelectResult:
+    """Выполняется в процессе-воркере: select_top_photos над фото задания."""
+    from src.infrastructure.vision.photo_selector import select_top_photos
+
+    shm = None
+    if job.shm_name:
+        shm = shared_memory.SharedMemory(name=job.shm_name)
+        # блоком владеет родитель (он и делает unlink); без этого resource_tracker
+        # воркера считает блок своим и «убирает» его при завершении процесса
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    photos = []
+    try:
+        photos = [
+            PhotoDTO(
+                photo_id=item.photo_id,
+                owner_id=item.owner_id,
+                url='',
+                likes_count=item.likes_count,
+                local_path=item.path,
+                # срез общей памяти без копирования — cv2.imdecode читает прямо из него
+                content=shm.buf[item.offset:item.offset + item.size] if item.size else None,
+            )
+            for item in job.photos
+        ]
+        selected = select_top_photos(_worker_detector, photos, top_n=job.top_n, resolve=Path)
+
+        by_id = {id(p): i for i, p in enumerate(photos)}
+        return _SelectResult(
+            statuses=[(p.status, p.reject_reason) for p in photos],
+            selected=[by_id[id(p)] for p in selected],
+        )
+    finally:
+        # срезы буфера нужно отпустить до shm.close() — и при ошибке тоже
+        try:
+            for p in photos:
+                if isinstance(p.content, memoryview):
+                    p.content.release()
+                p.content = None
+            if shm is not None:
+                shm.close()
+        except BufferError:
+            # на буфер ещё ссылается массив (например, из трассировки исключения) —
+            # не подменяем исходную ошибку, память освободится вместе с процессом
+            logger.warning('VisionExecutor: shared memory %s не закрыта — буфер ещё используется', job.shm_name)
@@ -0,0 +1,23 @@
+# декодирование изображения один раз: load_image(путь | байты | массив) → BGR ndarray
+
+from pathlib import Path
+from typing import Union
+
+import cv2
+import numpy as np
+
+# что принимают функции vision: путь к файлу, сжатые байты (JPEG/PNG...) или уже декодированный BGR-массив
+ImageInput = Union[str, Path, bytes, bytearray, memoryview, np.ndarray]
+
+
+def load_image(image: ImageInput) -> np.ndarray | None:
+    """
+    Приводит изображение к BGR-массиву (формат OpenCV / InsightFace).
+    Массив возвращается как есть, без копирования; байты декодируются
+    cv2.imdecode, путь — cv2.imread. None — не удалось прочитать/декодировать.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(str(image))
@@ -1,12 +1,15 @@
-# оркестратор: detect → filter → blur → embed → cosine similarity → топ-3
+# оркестратор: detect → filter → blur → embed пачкой (только прошедшие) → cosine similarity → топ-3
 
 import logging
+import numpy as np
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Callable
 
-from src.infrastructure.vision.detector import FaceDetector, DetectedFace
+from src.infrastructure.vision.detector import FaceDetector, DetectedFace, DETECT_BATCH_MAX
 from src.infrastructure.vision.embedder import get_embedding, cosine_similarity
 from src.infrastructure.vision.blur_check import calc_blur_score, MIN_BLUR_SCORE
+from src.infrastructure.vision.image_io import load_image
 from src.infrastructure.db.repositories import PhotoDTO
 
 logger = logging.getLogger(__name__)
@@ -42,31 +45,86 @@ def select_top_photos(
         detector: FaceDetector,
         photos: list[PhotoDTO],
         top_n: int = 3,
+        resolve: Callable[[str], Path] = Path,
 ) -> list[PhotoDTO]:
     """
-    Пайплайн выбора фото — последовательная обработка:
+    Пайплайн выбора фото:
 
-    1) Берём первое фото, анализируем (detect → filter → blur), сохраняем в группу
-    2) Берём следующее фото, анализируем. Сравниваем эмбеддинг с фото в каждой группе:
+    1) Фото детектируем пачками по DETECT_BATCH_MAX (detect_many — один запуск SCRFD
+       на пачку), затем каждое: filter (1 лицо, score, размер) → blur;
+       лицо прошедшего фото выравниваем для ArcFace
+    2) Эмбеддинги прошедших лиц пачки — одним запуском ArcFace (embed_batch)
+    3) Раскладываем прошедшие фото по группам (в порядке лайков). Сравниваем эмбеддинг с фото в каждой группе:
        - если совпадает с группой → добавляем в эту группу
        - если не совпадает ни с одной → создаём новую группу
-    3) Повторяем, пока в какой-то группе не наберётся top_n фото
-       или пока не закончатся фото
-    4) Берём самую большую группу, ранжируем по лайкам → top_n = selected
+    4) Повторяем с новой пачкой, пока в какой-то группе не наберётся top_n фото
+       или пока не закончатся фото. Досрочный выход — как при обработке по одному:
+       фото после набравшего top_n остаются raw (их статусы из пачки сбрасываются)
+    5) Берём самую большую группу, ранжируем по лайкам → top_n = selected
+
+    resolve — путь файла по PhotoDTO.local_path (ключ хранилища фото → путь).
+    Каждое фото декодируется один раз (из content при анализе в памяти или
+    из файла), и один и тот же массив идёт в детектор, blur-check и выравнивание.
 
     Возвращает список PhotoDTO (до top_n штук) с обновлёнными статусами.
     """
     groups: list[FaceGroup] = []
 
-    for photo in photos:
-        if not photo.local_path or not Path(photo.local_path).exists():
+    for start in range(0, len(photos), DETECT_BATCH_MAX):
+        chunk = photos[start:start + DETECT_BATCH_MAX]
+        analyzed, aligned = _analyze_chunk(detector, chunk, resolve)
+
+        # ArcFace — одним запуском для всех прошедших лиц пачки
+        if analyzed:
+            detector.embed_batch([a.face for a in analyzed], aligned)
+
+        for candidate in analyzed:
+            # ищем подходящую группу
+            matched_group = None
+            for group in groups:
+                if group.matches(candidate):
+                    matched_group = group
+                    break
+
+            if matched_group is None:
+                # новый человек — создаём новую группу
+                groups.append(FaceGroup(photos=[candidate]))
+                continue
+
+            matched_group.photos.append(candidate)
+            # если набрали top_n фото одного человека — сразу выходим
+            if len(matched_group.photos) >= top_n:
+                logger.info(
+                    'Кандидат %s: набрано %d фото одного человека, досрочный выход',
+                    candidate.photo_dto.owner_id, top_n
+                )
+                _reset_after(chunk, candidate.photo_dto)
+                return _pick_best(groups, photos, top_n)
+
+    return _pick_best(groups, photos, top_n)
+
+
+def _analyze_chunk(
+        detector: FaceDetector,
+        chunk: list[PhotoDTO],
+        resolve: Callable[[str], Path],
+) -> tuple[list[AnalyzedPhoto], list[np.ndarray]]:
+    """Пачка фото: detect (одним запуском) → filter → blur. Возвращает прошедшие и их выровненные лица."""
+    loaded = []
+    for photo in chunk:
+        image = _load_image(photo, resolve)
+        if image is None:
             photo.status = 'rejected'
             photo.reject_reason = 'error'
             continue
+        loaded.append((photo, image))
 
-        # детекция лиц
-        faces = detector.detect(photo.local_path)
+    # детекция лиц — пачкой
+    detections = detector.detect_many([image for _, image in loaded])
 
+    analyzed: list[AnalyzedPhoto] = []
+    aligned = []
+    for (photo, image), faces in zip(loaded, detections):
         # фильтр: ровно 1 лицо, det_score, размер
         face = detector.filter_single_face(faces)
         if face is None:
@@ -77,7 +135,7 @@ def select_top_photos(
             continue
 
         # blur-check
-        blur_score = calc_blur_score(photo.local_path, face.bbox)
+        blur_score = calc_blur_score(image, face.bbox)
         if blur_score < MIN_BLUR_SCORE:
             photo.status = 'rejected'
             photo.reject_reason = 'blurry'
@@ -86,29 +144,21 @@ def select_top_photos(
 
         # фото прошло все фильтры — промежуточный статус accepted
         photo.status = 'accepted'
-        analyzed = AnalyzedPhoto(photo_dto=photo, face=face, blur_score=blur_score)
+        analyzed.append(AnalyzedPhoto(photo_dto=photo, face=face, blur_score=blur_score))
+        aligned.append(detector.align(image, face))
+    return analyzed, aligned
 
-        # ищем подходящую группу
-        matched_group = None
-        for group in groups:
-            if group.matches(analyzed):
-                matched_group = group
-                break
 
-        if matched_group is not None:
-            matched_group.photos.append(analyzed)
-            # если набрали top_n фото одного человека — сразу выходим
-            if len(matched_group.photos) >= top_n:
-                logger.info(
-                    'Кандидат %s: набрано %d фото одного человека, досрочный выход',
-                    photo.owner_id, top_n
-                )
-                break
-        else:
-            # новый человек — создаём новую группу
-            new_group = FaceGroup(photos=[analyzed])
-            groups.append(new_group)
+def _reset_after(chunk: list[PhotoDTO], last: PhotoDTO) -> None:
+    """Фото пачки после last до выбора не дошли — возвращаем им статус raw."""
+    idx = next(i for i, p in enumerate(chunk) if p is last)
+    for photo in chunk[idx + 1:]:
+        photo.status = 'raw'
+        photo.reject_reason = None
+
 
+def _pick_best(groups: list[FaceGroup], photos: list[PhotoDTO], top_n: int) -> list[PhotoDTO]:
+    """Самая большая группа → её top_n по лайкам получают статус selected."""
     if not groups:
         return []
 
@@ -135,6 +185,17 @@ def select_top_photos(
     return result
 
 
+def _load_image(photo: PhotoDTO, resolve: Callable[[str], Path]) -> np.ndarray | None:
+    """Декодированное изображение для анализа: из памяти (content) или из файла (None — нечего анализировать)."""
+    if photo.content is not None:
+        return load_image(photo.content)
+
+    path = resolve(photo.local_path) if photo.local_path else None
+    if path is None or not path.exists():
+        return None
+    return load_image(path)
+
+
 def _get_reject_reason(faces: list[DetectedFace]) -> str:
     """Определяет причину отклонения фото по результатам детекции."""
     if len(faces) == 0:
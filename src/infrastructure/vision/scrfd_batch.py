@@ -0,0 +1,123 @@
+# пакетная детекция SCRFD: N фото → letterbox до det_size → один session.run → лица по каждому фото
+
+import cv2
+import numpy as np
+from insightface.model_zoo.scrfd import SCRFD, distance2bbox, distance2kps
+
+
+def letterbox(img: np.ndarray, input_size: tuple[int, int]) -> tuple[np.ndarray, float]:
+    """
+    Вписывает изображение в input_size (w, h) с сохранением пропорций,
+    остаток заполняется чёрным (как в SCRFD.detect).
+    Возвращает (кадр input_size, масштаб det_scale).
+    """
+    input_w, input_h = input_size
+    im_ratio = float(img.shape[0]) / img.shape[1]
+    model_ratio = float(input_h) / input_w
+    if im_ratio > model_ratio:
+        new_height = input_h
+        new_width = int(new_height / im_ratio)
+    else:
+        new_width = input_w
+        new_height = int(new_width * im_ratio)
+    det_scale = float(new_height) / img.shape[0]
+
+    det_img = np.zeros((input_h, input_w, 3), dtype=np.uint8)
+    det_img[:new_height, :new_width, :] = cv2.resize(img, (new_width, new_height))
+    return det_img, det_scale
+
+
+def detect_batch(
+        model: SCRFD,
+        images: list[np.ndarray],
+        max_num: int = 0,
+) -> list[tuple[np.ndarray, np.ndarray | None]]:
+    """
+    Детекция лиц на нескольких изображениях одним запуском модели.
+    Модель должна поддерживать batch (model.batched — выходы вида [N, K, C]).
+    Для каждого изображения возвращает (det [n, 5] — bbox + score, kpss [n, 5, 2] или None)
+    в координатах исходного изображения — то же, что SCRFD.detect.
+    """
+    input_size = model.input_size
+    boxed = [letterbox(img, input_size) for img in images]
+
+    blob = cv2.dnn.blobFromImages(
+        [det_img for det_img, _ in boxed], 1.0 / model.input_std, input_size,
+        (model.input_mean, model.input_mean, model.input_mean), swapRB=True,
+    )
+    net_outs = model.session.run(model.output_names, {model.input_name: blob})
+    input_height, input_width = blob.shape[2], blob.shape[3]
+
+    results = []
+    for b, (img, (_, det_scale)) in enumerate(zip(images, boxed)):
+        scores_list, bboxes_list, kpss_list = _decode(model, net_outs, b, input_height, input_width)
+        results.append(_postprocess(model, img, det_scale, scores_list, bboxes_list, kpss_list, max_num))
+    return results
+
+
+def _decode(model: SCRFD, net_outs: list[np.ndarray], b: int, input_height: int, input_width: int):
+    """Выходы модели для изображения b пачки → кандидаты лиц выше det_thresh (как SCRFD.forward)."""
+    scores_list, bboxes_list, kpss_list = [], [], []
+    fmc = model.fmc
+    for idx, stride in enumerate(model._feat_stride_fpn):
+        scores = net_outs[idx][b]
+        bbox_preds = net_outs[idx + fmc][b] * stride
+
+        height = input_height // stride
+        width = input_width // stride
+        anchor_centers = _anchor_centers(model, height, width, stride)
+
+        pos_inds = np.where(scores >= model.det_thresh)[0]
+        bboxes = distance2bbox(anchor_centers, bbox_preds)
+        scores_list.append(scores[pos_inds])
+        bboxes_list.append(bboxes[pos_inds])
+        if model.use_kps:
+            kps_preds = net_outs[idx + fmc * 2][b] * stride
+            kpss = distance2kps(anchor_centers, kps_preds)
+            kpss = kpss.reshape((kpss.shape[0], -1, 2))
+            kpss_list.append(kpss[pos_inds])
+    return scores_list, bboxes_list, kpss_list
+
+
+def _anchor_centers(model: SCRFD, height: int, width: int, stride: int) -> np.ndarray:
+    """Центры якорей уровня stride (кэш модели общий с SCRFD.forward)."""
+    key = (height, width, stride)
+    anchor_centers = model.center_cache.get(key)
+    if anchor_centers is None:
+        anchor_centers = np.stack(np.mgrid[:height, :width][::-1], axis=-1).astype(np.float32)
+        anchor_centers = (anchor_centers * stride).reshape((-1, 2))
+        if model._num_anchors > 1:
+            anchor_centers = np.stack([anchor_centers] * model._num_anchors, axis=1).reshape((-1, 2))
+        if len(model.center_cache) < 100:
+            model.center_cache[key] = anchor_centers
+    return anchor_centers
+
+
+def _postprocess(model: SCRFD, img, det_scale, scores_list, bboxes_list, kpss_list, max_num):
+    """Масштаб к исходному изображению, NMS и max_num (как SCRFD.detect)."""
+    scores = np.vstack(scores_list)
+    order = scores.ravel().argsort()[::-1]
+    bboxes = np.vstack(bboxes_list) / det_scale
+    pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)
+    pre_det = pre_det[order, :]
+    keep = model.nms(pre_det)
+    det = pre_det[keep, :]
+
+    kpss = None
+    if model.use_kps:
+        kpss = np.vstack(kpss_list) / det_scale
+        kpss = kpss[order, :, :][keep, :, :]
+
+    if max_num > 0 and det.shape[0] > max_num:
+        area = (det[:, 2] - det[:, 0]) * (det[:, 3] - det[:, 1])
+        img_center = img.shape[0] // 2, img.shape[1] // 2
+        offsets = np.vstack([
+            (det[:, 0] + det[:, 2]) / 2 - img_center[1],
+            (det[:, 1] + det[:, 3]) / 2 - img_center[0],
+        ])
+        offset_dist_squared = np.sum(np.power(offsets, 2.0), 0)
+        bindex = np.argsort(area - offset_dist_squared * 2.0)[::-1][:max_num]
+        det = det[bindex, :]
+        if kpss is not None:
+            kpss = kpss[bindex, :]
+    return det, kpss
@@ -0,0 +1,223 @@
+# склейка близких по времени вызовов VK в один execute (до 25 методов за запрос)
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any
+
+from src.core.config import VK_BATCH_WINDOW_SEC
+from src.core.exceptions import VkApiError
+from src.infrastructure.vk.client import VkClient, breaker_open_error
+from src.infrastructure.vk.rate_limiter import current_priority
+from src.infrastructure.vk.resilience import RETRY_POLICIES, STATE_CLOSED
+
+logger = logging.getLogger(__name__)
+
+# VK ограничивает execute 25 вызовами API за один запрос
+EXECUTE_MAX_CALLS = 25
+
+
+@dataclass
+class _PendingCall:
+    """Вызов, ожидающий отправки в составе execute."""
+    method: str
+    params: dict[str, Any]
+    future: asyncio.Future
+    attempt: int = 0   # номер повтора после ошибки внутри execute
+
+
+@dataclass
+class VkBatcher:
+    """
+    Собирает вызовы одного токена, сделанные в пределах window_sec,
+    и отправляет их одним запросом execute.
+
+    Каждый вызывающий получает свой результат в привычном формате
+    {"response": ...} или свой VkApiError — как при прямом вызове VkClient.
+
+    Интерактивные и фоновые вызовы собираются в разные пачки, чтобы запрос
+    пользователя не ехал в одном execute с предзагрузкой по фоновой полосе.
+
+    Circuit breaker и повторы работают по реальному методу, а не по execute:
+    вызов метода с разомкнутым breaker'ом в пачку не попадает, исход каждого
+    вызова внутри execute учитывается breaker'ом метода, а ошибки с политикой
+    повтора (6, 9, 10) ставятся в следующую пачку с backoff из RETRY_POLICIES.
+    """
+    client: VkClient
+    window_sec: float = VK_BATCH_WINDOW_SEC
+    max_calls: int = EXECUTE_MAX_CALLS
+    _pending: dict[tuple[str, int], list[_PendingCall]] = field(default_factory=dict, repr=False)
+    # фоновые задачи (окна, отправки, повторы): держим ссылки, чтобы их не собрал GC
+    _tasks: set[asyncio.Task] = field(default_factory=set, repr=False)
+
+    async def close(self) -> None:
+        """Отменяет неотправленные пачки и фоновые задачи (вызывать при остановке бота до VkClient.close)."""
+        for batch in self._pending.values():
+            for call in batch:
+                call.future.cancel()
+        self._pending.clear()
+
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def call(self, method: str, *, access_token: str, params: dict[str, Any]) -> dict[str, Any]:
+        """Ставит вызов в пачку токена и ждёт его результат."""
+        if not self.client.get_breaker(method).allow():
+            raise breaker_open_error(method)
+
+        future = asyncio.get_running_loop().create_future()
+        key = (access_token, current_priority())
+        self._enqueue(key, _PendingCall(method=method, params=dict(params), future=future))
+        return await future
+
+    def _enqueue(self, key: tuple[str, int], call: _PendingCall) -> None:
+        """Добавляет вызов в текущую пачку ключа (токен, приоритет)."""
+        batch = self._pending.setdefault(key, [])
+        batch.append(call)
+
+        if len(batch) >= self.max_calls:
+            # пачка заполнена — отправляем сразу, не дожидаясь окна
+            self._pending.pop(key, None)
+            self._spawn(self._send(key, batch), batch)
+        elif len(batch) == 1:
+            # первый вызов в пачке — запускаем таймер окна
+            self._spawn(self._flush_later(key, batch), batch)
+
+    def _spawn(self, coro, calls: list[_PendingCall]) -> None:
+        """Фоновая задача над вызовами calls; если её отменят — ожидание вызывающих тоже отменяется."""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._on_task_done(t, calls))
+
+    def _on_task_done(self, task: asyncio.Task, calls: list[_PendingCall]) -> None:
+        self._tasks.discard(task)
+        if task.cancelled():
+            for call in calls:
+                call.future.cancel()
+
+    async def _flush_later(self, key: tuple[str, int], batch: list[_PendingCall]) -> None:
+        """Отправляет пачку по истечении окна (если её ещё не отправили)."""
+        await asyncio.sleep(self.window_sec)
+        if self._pending.get(key) is batch:
+            self._pending.pop(key, None)
+            await self._send(key, batch)
+
+    async def _send(self, key: tuple[str, int], batch: list[_PendingCall]) -> None:
+        """Выполняет пачку: один вызов — напрямую, несколько — через execute."""
+        # вызывающие, которые уже отменили ожидание, в запрос не попадают
+        batch = [c for c in batch if not c.future.done()]
+        if not batch:
+            return
+
+        access_token, priority = key
+
+        if len(batch) == 1:
+            call = batch[0]
+            try:
+                data = await self.client.call(
+                    call.method, access_token=access_token, params=call.params,
+                    priority=priority, breaker_admitted=True,
+                )
+            except Exception as e:
+                _set_exception(call.future, e)
+            else:
+                _set_result(call.future, data)
+            return
+
+        try:
+            data = await self.client.call(
+                'execute',
+                access_token=access_token,
+                params={'code': _build_execute_code(batch)},
+                priority=priority,
+            )
+        except VkApiError as e:
+            # упал весь execute (повторы execute уже исчерпаны) — ошибку получает каждый вызов пачки
+            for call in batch:
+                self.client.record_error(call.method, e.code)
+                _set_exception(call.future, e)
+            return
+        except Exception as e:
+            for call in batch:
+                self.client.get_breaker(call.method).release()
+                _set_exception(call.future, e)
+            return
+
+        logger.debug('execute: %d вызовов одним запросом', len(batch))
+        for call, outcome in zip(batch, _distribute(batch, data)):
+            breaker = self.client.get_breaker(call.method)
+            if not isinstance(outcome, VkApiError):
+                breaker.record_success()
+                _set_result(call.future, outcome)
+                continue
+
+            self.client.record_error(call.method, outcome.code)
+            policy = RETRY_POLICIES.get(outcome.code)
+            if policy is None or call.attempt + 1 >= policy.max_attempts or breaker.state != STATE_CLOSED:
+                _set_exception(call.future, outcome)
+                continue
+
+            delay = policy.delay(call.attempt)
+            logger.info('VK %s в execute: ошибка %d, повтор через %.2f с', call.method, outcome.code, delay)
+            call.attempt += 1
+            self._spawn(self._retry_later(key, call, delay), [call])
+
+    async def _retry_later(self, key: tuple[str, int], call: _PendingCall, delay: float) -> None:
+        """Повтор вызова после паузы backoff — в очередной пачке того же токена и приоритета."""
+        await asyncio.sleep(delay)
+        if not call.future.done():
+            self._enqueue(key, call)
+
+
+def _build_execute_code(batch: list[_PendingCall]) -> str:
+    """VKScript вида: return [API.users.get({...}),API.photos.get({...})];"""
+    calls = ','.join(
+        f'API.{c.method}({json.dumps(c.params, ensure_ascii=False)})'
+        for c in batch
+    )
+    return f'return [{calls}];'
+
+
+def _distribute(batch: list[_PendingCall], data: dict[str, Any]) -> list[dict[str, Any] | VkApiError]:
+    """
+    Раскладывает ответ execute по вызовам: {"response": ...} или VkApiError на каждый.
+    Упавший внутри execute метод возвращает false, а его ошибка
+    лежит в execute_errors (в порядке возникновения).
+    """
+    results = data.get('response')
+    if not isinstance(results, list) or len(results) != len(batch):
+        err = VkApiError(-1010, 'Malformed execute response', raw=data)
+        return [err] * len(batch)
+
+    errors = list(data.get('execute_errors', []))
+
+    return [
+        _pop_error(errors, call.method, data) if result is False else {'response': result}
+        for call, result in zip(batch, results)
+    ]
+
+
+def _pop_error(errors: list[dict], method: str, raw: dict) -> VkApiError:
+    """Берёт первую неразобранную ошибку этого метода из execute_errors."""
+    for i, err in enumerate(errors):
+        if err.get('method') == method:
+            errors.pop(i)
+            return VkApiError(
+                code=int(err.get('error_code', -1)),
+                msg=str(err.get('error_msg', 'Unknow VK error')),
+                raw={'error': err},
+            )
+    return VkApiError(-1011, f'{method} failed inside execute', raw=raw)
+
+
+def _set_result(future: asyncio.Future, value: Any) -> None:
+    if not future.done():
+        future.set_result(value)
+
+
+def _set_exception(future: asyncio.Future, exc: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exc)
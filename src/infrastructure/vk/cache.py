@@ -0,0 +1,98 @@
+# кэш ответов идемпотентных методов VK: TTL на метод + ограниченный LRU
+
+import copy
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from src.core.config import (
+    VK_CACHE_MAX_ENTRIES, VK_CACHE_TTL_CITIES, VK_CACHE_TTL_PHOTOS,
+)
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    Правило кэширования одного метода VK.
+    ttl_sec — сколько живёт ответ
+    shared — ключ без токена: ответ не зависит от того, кто спрашивает,
+             и его можно отдавать другим пользователям
+    """
+    ttl_sec: float
+    shared: bool = True
+
+
+DEFAULT_POLICIES: dict[str, CachePolicy] = {
+    'database.getCities': CachePolicy(ttl_sec=VK_CACHE_TTL_CITIES),
+    # видимость фото закрытых профилей и «только для друзей» зависит от токена
+    'photos.get': CachePolicy(ttl_sec=VK_CACHE_TTL_PHOTOS, shared=False),
+}
+
+
+class VkResponseCache:
+    """
+    In-memory кэш ответов VK.
+    Ключ — метод + параметры (+ токен, если метод не shared).
+    Кэшируются только успешные ответы; ошибки VK всегда идут мимо кэша.
+    Кэш хранит и отдаёт копии ответов: правка полученного dict вызывающим
+    не портит запись для следующих (в том числе других пользователей).
+    При переполнении вытесняется давно не использованная запись (LRU).
+    """
+
+    def __init__(
+            self,
+            policies: dict[str, CachePolicy] | None = None,
+            max_entries: int = VK_CACHE_MAX_ENTRIES,
+    ):
+        self.policies = DEFAULT_POLICIES if policies is None else policies
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _make_key(self, method: str, access_token: str, params: dict[str, Any]) -> str | None:
+        """Ключ кэша или None, если этот вызов не кэшируется."""
+        policy = self.policies.get(method)
+        if policy is None:
+            return None
+
+        key_params = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        if policy.shared:
+            return f'{method}:{key_params}'
+        return f'{method}:{access_token}:{key_params}'
+
+    def get(self, method: str, *, access_token: str, params: dict[str, Any]) -> dict[str, Any] | None:
+        """Свежий ответ из кэша или None."""
+        key = self._make_key(method, access_token, params)
+        if key is None:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def put(self, method: str, *, access_token: str, params: dict[str, Any], data: dict[str, Any]) -> None:
+        """Сохраняет успешный ответ (если метод кэшируемый)."""
+        key = self._make_key(method, access_token, params)
+        if key is None:
+            return
+
+        expires_at = time.monotonic() + self.policies[method].ttl_sec
+        self._entries[key] = (expires_at, copy.deepcopy(data))
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, int]:
+        """Счётчики для логов/диагностики."""
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
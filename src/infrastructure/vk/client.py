@@ -1,15 +1,25 @@
 # HTTP-клиент VK (token per user, retry/backoff)
 
+import logging
 import aiohttp
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any
 
 import asyncio
 
-from src.core.config import VK_API_VERSION
+from src.core.config import (
+    VK_API_VERSION, VK_API_BASE_URL, VK_CONN_LIMIT_PER_HOST, VK_DNS_CACHE_TTL, VK_KEEPALIVE_TIMEOUT,
+)
 from src.core.exceptions import VkApiError
+from src.infrastructure.vk.rate_limiter import VkRateLimiter, current_priority
+from src.infrastructure.vk.resilience import (
+    NETWORK_ERROR_CODE, RETRY_POLICIES, STATE_CLOSED, STATE_OPEN, CircuitBreaker,
+)
 
-@dataclass(frozen=True)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
 class VkClient:
     """
     Низкоуровневый HTTP-клиент VK.
@@ -19,19 +29,74 @@ class VkClient:
     - распарсить JSON
     - если VK вернул "error" — поднять VkApiError
     - если сеть/таймаут — тоже поднять VkApiError
+
+    Клиент держит одну долгоживущую aiohttp-сессию с пулом соединений
+    (keep-alive + DNS-кэш), чтобы не платить за TCP+TLS на каждый запрос.
+    Сессия открывается в start() и закрывается в close() вместе с ботом.
+
+    Перед каждым запросом берётся слот лимита токена (rate_limiter):
+    интерактивные вызовы обслуживаются раньше фоновых (см. background_priority).
+
+    Повторы — по кодам ошибок (RETRY_POLICIES: сеть, 6, 9, 10) с jitter-backoff;
+    на каждый метод свой circuit breaker, который отказывает сразу, пока VK деградировал.
     """
     api_version = VK_API_VERSION
-    base_url ='https://api.vk.com/method'
+    base_url = VK_API_BASE_URL
     timeout_sec = 10
-    retries = 2                             # количество повторов при сетевых проблемах
 
-    async def call(self, method: str, *, access_token: str, params: dict[str, Any]) -> dict[str, Any]:
+    conn_limit_per_host: int = VK_CONN_LIMIT_PER_HOST   # макс. соединений на хост
+    dns_cache_ttl: int = VK_DNS_CACHE_TTL               # TTL DNS-кэша, сек
+    keepalive_timeout: float = VK_KEEPALIVE_TIMEOUT     # сколько держать простаивающее соединение
+    rate_limiter: VkRateLimiter = field(default_factory=VkRateLimiter, repr=False)
+    _session: aiohttp.ClientSession | None = field(default=None, repr=False)
+    _breakers: dict[str, CircuitBreaker] = field(default_factory=dict, repr=False)
+
+    async def start(self) -> None:
+        """Открывает пул соединений (вызывать один раз при старте бота)."""
+        if self._session is not None and not self._session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.conn_limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout_sec),
+        )
+
+    async def close(self) -> None:
+        """Закрывает пул соединений (вызывать при остановке бота)."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Сессия пула; если start() не вызывали — открываем лениво."""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def call(
+            self, method: str, *,
+            access_token: str,
+            params: dict[str, Any],
+            priority: int | None = None,
+            breaker_admitted: bool = False,
+    ) -> dict[str, Any]:
         """
         Универсальный вызов VK метода.
         method: "users.get", "photos.get" и т.д.
         access_token: пользовательский токен
         params: параметры метода (без access_token и v — добавим сами)
+        priority: полоса лимитера; по умолчанию — приоритет текущей задачи
+        breaker_admitted: вызов уже пропущен breaker'ом метода (VkBatcher) —
+                          повторно allow() не спрашиваем, чтобы не съесть пробный запрос
         """
+        if priority is None:
+            priority = current_priority()
+
         # собираем ссылку с методом
         url = f'{self.base_url}/{method}'
 
@@ -40,17 +105,21 @@ class VkClient:
         payload['access_token'] = access_token
         payload['v'] = self.api_version
 
-        timeout = aiohttp.ClientTimeout(total=self.timeout_sec)
+        breaker = self.get_breaker(method)
+        if not breaker_admitted and not breaker.allow():
+            raise breaker_open_error(method)
 
-        # при ошибке соединения
-        last_excp: Exception | None = None
+        attempt = 0
+        while True:
+            # ждём свободный слот лимита токена (повторы тоже расходуют лимит)
+            await self.rate_limiter.acquire(access_token, priority)
 
-        for attempt in range(self.retries):
             try:
-                # на каждый вызов создаем сессию
-                async with aiohttp.ClientSession(timeout=timeout) as session:
-                    async with session.get(url, params=payload, ssl=False) as resp:
-                        data = await resp.json(content_type=None)
+                # переиспользуем соединения из пула сессии;
+                # параметры — в теле POST: execute и users.get на 1000 id не влезают в URL
+                session = await self._get_session()
+                async with session.post(url, data=payload, ssl=False) as resp:
+                    data = await resp.json(content_type=None)
 
                 # Если VK API возвращает ошибки в поле "error"
                 if isinstance(data, dict) and 'error' in data:
@@ -60,14 +129,46 @@ class VkClient:
                         msg=str(err.get('error_msg', 'Unknow VK error')),
                         raw=data
                     )
-                
+
+                breaker.record_success()
                 return data
+            except VkApiError as e:
+                error = e
             except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = VkApiError(NETWORK_ERROR_CODE, f"Network/timeout error: {e!r}")
+                error.__cause__ = e
+
+            self.record_error(method, error.code)
+
+            policy = RETRY_POLICIES.get(error.code)
+            if policy is None or attempt + 1 >= policy.max_attempts or breaker.state != STATE_CLOSED:
+                raise error
+
+            delay = policy.delay(attempt)
+            logger.info('VK %s: ошибка %d, повтор через %.2f с', method, error.code, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def get_breaker(self, method: str) -> CircuitBreaker:
+        """Circuit breaker метода (общий для прямых вызовов и вызовов внутри execute)."""
+        breaker = self._breakers.get(method)
+        if breaker is None:
+            breaker = CircuitBreaker()
+            self._breakers[method] = breaker
+        return breaker
+
+    def breaker_states(self) -> dict[str, str]:
+        """Состояние circuit breaker'ов по методам: closed / open / half_open."""
+        return {method: b.state for method, b in self._breakers.items()}
+
+    def record_error(self, method: str, code: int) -> None:
+        """Ошибку вызова — в breaker метода; его размыкание логируется вместе с состоянием остальных."""
+        breaker = self.get_breaker(method)
+        was_open = breaker.state == STATE_OPEN
+        breaker.record_error(code)
+        if not was_open and breaker.state == STATE_OPEN:
+            logger.warning('VK %s: circuit breaker разомкнут, breaker\'ы: %s', method, self.breaker_states())
 
-                last_excp = e
 
-                if attempt < self.retries - 1:
-                    await asyncio.sleep(0.4 * (attempt + 1))
-                else:
-                    raise VkApiError(-1000, f"Network/timeout error: {e!r}") from e
-        raise VkApiError(-1001, "Unexpected VK client error") from last_excp
+def breaker_open_error(method: str) -> VkApiError:
+    return VkApiError(-1002, f'Circuit breaker open for {method}: VK is degraded')
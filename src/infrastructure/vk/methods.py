@@ -2,16 +2,78 @@
 
 from __future__ import annotations
 
+import asyncio
 from dataclasses import dataclass
+from typing import Any
+
+from src.core.exceptions import VkApiError
+from src.infrastructure.vk.batcher import VkBatcher
+from src.infrastructure.vk.cache import VkResponseCache
 from src.infrastructure.vk.client import VkClient
+from src.infrastructure.vk.rate_limiter import PRIORITY_BACKGROUND, current_priority
+from src.infrastructure.vk.token_pool import VkTokenPool
+
+# ошибки токена пула, после которых вызов повторяется токеном пользователя:
+# 5 — токен отвергнут, 15/30/200 — у токена пула нет доступа (а у пользователя может быть)
+POOL_FALLBACK_CODES = {5, 15, 30, 200}
+
+# users.get принимает до 1000 user_ids за вызов
+USERS_GET_MAX_IDS = 1000
 
 
 @dataclass(frozen=True)
 class VkMethods:
     """
     Обёртка над VkClient: тут живут конкретные методы VK.
+    Если задан batcher — близкие по времени вызовы одного токена
+    уходят в VK одним запросом execute.
+    Если задан cache — ответы идемпотентных методов берутся из кэша.
+    Если задан token_pool — фоновые неперсональные вызовы (photos.get)
+    идут токенами пула, а не токеном пользователя.
     """
     client: VkClient
+    batcher: VkBatcher | None = None
+    cache: VkResponseCache | None = None
+    token_pool: VkTokenPool | None = None
+
+    async def _call(self, method: str, *, access_token: str, params: dict[str, Any]) -> dict:
+        """Вызов метода VK: кэш → batcher (если включён) или напрямую через клиент."""
+        if self.cache is not None:
+            cached = self.cache.get(method, access_token=access_token, params=params)
+            if cached is not None:
+                return cached
+
+        if self.batcher is not None:
+            data = await self.batcher.call(method, access_token=access_token, params=params)
+        else:
+            data = await self.client.call(method, access_token=access_token, params=params)
+
+        if self.cache is not None:
+            self.cache.put(method, access_token=access_token, params=params, data=data)
+        return data
+
+    async def _call_pooled(self, method: str, *, access_token: str, params: dict[str, Any]) -> dict:
+        """
+        Неперсональный вызов: в фоне — токеном из пула (если пул задан),
+        при отказе токена пула — повтор токеном пользователя.
+        Интерактивные вызовы всегда идут токеном пользователя.
+        """
+        if self.token_pool is None or current_priority() != PRIORITY_BACKGROUND:
+            return await self._call(method, access_token=access_token, params=params)
+
+        pool_token = self.token_pool.pick()
+        if pool_token is None:
+            return await self._call(method, access_token=access_token, params=params)
+
+        try:
+            return await self._call(method, access_token=pool_token, params=params)
+        except VkApiError as e:
+            if e.code not in POOL_FALLBACK_CODES:
+                raise
+            if e.code == 5:
+                self.token_pool.disable(pool_token)
+
+        return await self._call(method, access_token=access_token, params=params)
 
     async def users_get_me(self, *, access_token: str) -> dict:
         """
@@ -20,12 +82,43 @@ class VkMethods:
         - токен валиден
         - и узнать реальный vk_user_id владельца
         """
-        return await self.client.call(
+        return await self._call(
             "users.get",
             access_token=access_token,
             params={},  # user_ids не передаём специально
         )
 
+    async def users_get_many(
+            self, *,
+            access_token: str,
+            user_ids: list[int],
+            fields: str = "domain,is_closed,can_access_closed",
+            chunk_size: int = USERS_GET_MAX_IDS
+    ) -> list[dict]:
+        """
+        users.get для многих пользователей: id режутся на пачки по chunk_size
+        (до 1000), пачки запрашиваются параллельно. Возвращает общий список items.
+        """
+        ids = list(dict.fromkeys(user_ids))
+        chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+
+        responses = await asyncio.gather(*(
+            self._call(
+                "users.get",
+                access_token=access_token,
+                params={
+                    "user_ids": ",".join(str(i) for i in chunk),
+                    "fields": fields,
+                },
+            )
+            for chunk in chunks
+        ))
+
+        items = []
+        for data in responses:
+            items.extend(data.get("response", []))
+        return items
+
     async def database_get_cities(
             self, *,
             access_token: str,
@@ -37,7 +130,7 @@ class VkMethods:
         database.getCities — резолвит название города в city_id.
         country_id=1 — Россия по умолчанию.
         """
-        return await self.client.call(
+        return await self._call(
             "database.getCities",
             access_token=access_token,
             params={
@@ -54,23 +147,34 @@ class VkMethods:
             sex: int,
             age_from: int,
             age_to: int,
-            count: int = 50
+            count: int = 50,
+            offset: int = 0,
+            birth_month: int | None = None
     ) -> dict:
         """
         Поиск пользователей VK по city_id (числовой идентификатор города).
+        offset — смещение страницы (VK отдаёт не больше 1000 результатов на запрос).
+        birth_month — сузить поиск до месяца рождения (для поиска срезами).
+        Поля is_closed / can_access_closed / has_photo нужны, чтобы
+        отсеять закрытых и безфотых кандидатов ещё до очереди.
         """
-        return await self.client.call(
+        params = {
+            "city": city_id,
+            "sex": sex,
+            "age_from": age_from,
+            "age_to": age_to,
+            "count": count,
+            "offset": offset,
+            "has_photo": 1,
+            "fields": "first_name,last_name,domain,city,is_closed,can_access_closed,has_photo",
+        }
+        if birth_month is not None:
+            params["birth_month"] = birth_month
+
+        return await self._call(
             "users.search",
             access_token=access_token,
-            params={
-                "city": city_id,
-                "sex": sex,
-                "age_from": age_from,
-                "age_to": age_to,
-                "count": count,
-                "has_photo": 1,
-                "fields": "first_name,last_name,domain,city",
-            },
+            params=params,
         )
 
     async def photos_get(
@@ -85,8 +189,9 @@ class VkMethods:
         photos.get — получить фото пользователя.
         album_id='profile' — фото профиля.
         extended=1 — вернёт likes_count.
+        В фоне идёт токеном из пула (если задан), см. _call_pooled.
         """
-        return await self.client.call(
+        return await self._call_pooled(
             "photos.get",
             access_token=access_token,
             params={
@@ -0,0 +1,228 @@
+# скачивание фото с CDN VK: общий пул соединений, потоковая запись в хранилище фото
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+import aiofiles
+import aiofiles.os
+import aiohttp
+
+from src.core.config import (
+    PHOTO_DOWNLOAD_CONCURRENCY, PHOTO_CONN_LIMIT_PER_HOST, PHOTO_MAX_BYTES, PHOTO_DOWNLOAD_TIMEOUT_SEC,
+    PHOTO_HEDGE_PERCENTILE, PHOTO_HEDGE_MIN_DELAY_SEC,
+)
+from src.infrastructure.storage.photo_store import PhotoStore
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024  # размер куска потокового чтения, байт
+
+LATENCY_WINDOW = 200          # сколько последних времён скачивания помнить
+MIN_LATENCY_SAMPLES = 20      # меньше замеров — перцентиль ненадёжен, берём HEDGE_DEFAULT_DELAY_SEC
+HEDGE_DEFAULT_DELAY_SEC = 1.0
+
+
+@dataclass
+class PhotoDownloader:
+    """
+    Движок скачивания фото, общий для всех кандидатов и пользователей.
+
+    - одна aiohttp-сессия с пулом соединений и лимитом на хост CDN
+    - не больше max_concurrency скачиваний одновременно на весь бот
+    - тело читается кусками и пишется во временный файл через aiofiles
+      (запись на диск не блокирует event loop), попутно считается sha256;
+      затем файл атомарно переносится в PhotoStore под этим хэшем —
+      недокачанный файл никогда не виден в хранилище
+    - ответ больше max_bytes обрывается и не сохраняется
+    - fetch_bytes() — то же, но в память, без записи на диск (анализ фото в памяти)
+    - hedged-запросы: если фото не скачалось за hedge_percentile-й перцентиль
+      недавних времён скачивания, параллельно запрашивается другой размер
+      того же фото (alt_url); берётся первый успешный, второй отменяется
+
+    Сессия открывается в start() и закрывается в close() вместе с ботом.
+    """
+    store: PhotoStore = field(default_factory=PhotoStore)
+    max_concurrency: int = PHOTO_DOWNLOAD_CONCURRENCY
+    conn_limit_per_host: int = PHOTO_CONN_LIMIT_PER_HOST
+    max_bytes: int = PHOTO_MAX_BYTES
+    timeout_sec: float = PHOTO_DOWNLOAD_TIMEOUT_SEC
+    hedge_percentile: float = PHOTO_HEDGE_PERCENTILE     # 0 — без hedged-запросов
+    hedge_min_delay: float = PHOTO_HEDGE_MIN_DELAY_SEC
+    hedged: int = 0                                      # сколько раз отправлялся второй запрос
+    _session: aiohttp.ClientSession | None = field(default=None, repr=False)
+    _semaphore: asyncio.Semaphore | None = field(default=None, repr=False)
+    _latencies: deque = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW), repr=False)
+
+    async def start(self) -> None:
+        """Открывает пул соединений (вызывать один раз при старте бота)."""
+        if self._session is not None and not self._session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrency,
+            limit_per_host=self.conn_limit_per_host,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout_sec),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self) -> None:
+        """Закрывает пул соединений (вызывать при остановке бота)."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Сессия пула; если start() не вызывали — открываем лениво."""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    def hedge_delay(self) -> float:
+        """Через сколько секунд без ответа отправлять второй запрос."""
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return HEDGE_DEFAULT_DELAY_SEC
+        ordered = sorted(self._latencies)
+        idx = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+        return max(self.hedge_min_delay, ordered[idx])
+
+    async def download(self, url: str, alt_url: str | None = None) -> str | None:
+        """
+        Скачивает url в хранилище. Возвращает ключ фото (sha256) или None,
+        если скачать не удалось (HTTP-ошибка, сеть/таймаут, файл больше max_bytes).
+        alt_url — другой размер того же фото для hedged-запроса.
+        """
+        return await self._hedged(self._fetch, url, alt_url)
+
+    async def fetch_bytes(self, url: str, alt_url: str | None = None) -> bytes | None:
+        """
+        Скачивает url в память, минуя диск (для анализа фото в памяти).
+        Возвращает содержимое или None — на тех же условиях, что и download().
+        """
+        return await self._hedged(self._fetch_bytes, url, alt_url)
+
+    async def _hedged(self, fetch, url: str, alt_url: str | None):
+        """
+        Запуск fetch(url) с hedged-запросом fetch(alt_url), если первый задерживается.
+
+        Задержка hedge отсчитывается с момента, когда основной запрос получил слот
+        семафора: ожидание в локальной очереди — не медленная сеть. Второй запрос
+        отправляется, только если есть свободный слот — иначе он лишь встал бы
+        в ту же очередь и добавил нагрузки, когда пул и так заполнен.
+        Если основной запрос не удался без hedge, alt_url скачивается следом.
+        """
+        if not alt_url or alt_url == url or self.hedge_percentile <= 0:
+            return await self._in_slot(fetch, url)
+
+        got_slot = asyncio.Event()
+        primary = asyncio.create_task(self._in_slot(fetch, url, got_slot))
+        pending = {primary}
+        try:
+            slot_wait = asyncio.create_task(got_slot.wait())
+            try:
+                await asyncio.wait({primary, slot_wait}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                slot_wait.cancel()
+
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_delay())
+            if not done and self._semaphore.locked():
+                # свободных слотов нет — не хеджируем, ждём основной запрос
+                await primary
+                done = {primary}
+            if done:
+                result = primary.result()
+                if result is None:
+                    # основной запрос быстро не удался (404, обрыв) — пробуем другой размер
+                    return await self._in_slot(fetch, alt_url)
+                return result
+
+            # медленный CDN — параллельно запрашиваем другой размер;
+            # слот свободен, поэтому acquire() берёт его сразу, без ожидания
+            await self._semaphore.acquire()
+            self.hedged += 1
+            hedge = asyncio.create_task(fetch(alt_url))
+            # слот отпускается по завершении задачи — даже если её отменят до старта
+            hedge.add_done_callback(lambda _: self._semaphore.release())
+            pending.add(hedge)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result() is not None:
+                        return task.result()
+            return None
+        finally:
+            # проигравший (или все, если нас самих отменили) больше не нужен
+            for task in pending:
+                task.cancel()
+
+    async def _in_slot(self, fetch, url: str, got_slot: asyncio.Event | None = None):
+        """fetch(url) в слоте семафора (не больше max_concurrency скачиваний на весь бот)."""
+        await self._get_session()
+        async with self._semaphore:
+            if got_slot is not None:
+                got_slot.set()
+            return await fetch(url)
+
+    async def _fetch(self, url: str) -> str | None:
+        """Одно скачивание url → временный файл → хранилище (по sha256 содержимого); вызывать в слоте."""
+        session = await self._get_session()
+        tmp = await self.store.new_temp_path()
+        started = time.monotonic()
+        try:
+            async with session.get(url, ssl=False) as resp:
+                if resp.status != 200:
+                    return None
+                if resp.content_length is not None and resp.content_length > self.max_bytes:
+                    logger.info('Фото %s больше лимита (%d байт), пропускаем', url, resp.content_length)
+                    return None
+
+                size = 0
+                digest = hashlib.sha256()
+                async with aiofiles.open(tmp, 'wb') as f:
+                    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            logger.info('Фото %s больше лимита (%d байт), пропускаем', url, self.max_bytes)
+                            return None
+                        digest.update(chunk)
+                        await f.write(chunk)
+
+            key = await self.store.commit(tmp, digest.hexdigest())
+            self._latencies.append(time.monotonic() - started)
+            return key
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            return None
+        finally:
+            # после переноса в хранилище временного файла уже нет
+            if await aiofiles.os.path.exists(tmp):
+                await aiofiles.os.remove(tmp)
+
+    async def _fetch_bytes(self, url: str) -> bytes | None:
+        """Одно скачивание url в память (с тем же лимитом max_bytes); вызывать в слоте."""
+        session = await self._get_session()
+        started = time.monotonic()
+        try:
+            async with session.get(url, ssl=False) as resp:
+                if resp.status != 200:
+                    return None
+                if resp.content_length is not None and resp.content_length > self.max_bytes:
+                    logger.info('Фото %s больше лимита (%d байт), пропускаем', url, resp.content_length)
+                    return None
+
+                body = bytearray()
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    body += chunk
+                    if len(body) > self.max_bytes:
+                        logger.info('Фото %s больше лимита (%d байт), пропускаем', url, self.max_bytes)
+                        return None
+
+            self._latencies.append(time.monotonic() - started)
+            return bytes(body)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
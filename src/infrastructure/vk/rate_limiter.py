@@ -0,0 +1,144 @@
+# лимит запросов VK на токен (token bucket) с приоритетом интерактивных вызовов над фоновыми
+
+import asyncio
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from src.core.config import VK_RATE_LIMIT_PER_SEC, VK_RATE_BURST, VK_BACKGROUND_RESERVE
+
+# полосы приоритета: меньше значение — выше приоритет
+PRIORITY_INTERACTIVE = 0    # запросы из обработчиков (пользователь ждёт ответа)
+PRIORITY_BACKGROUND = 1     # предзагрузка и прочая фоновая работа
+
+# приоритет текущей задачи; asyncio.create_task копирует контекст,
+# поэтому фоновые задачи, запущенные внутри background_priority(), наследуют его
+_current_priority: contextvars.ContextVar[int] = contextvars.ContextVar(
+    'vk_priority', default=PRIORITY_INTERACTIVE,
+)
+
+
+def current_priority() -> int:
+    """Приоритет VK-вызовов текущей задачи."""
+    return _current_priority.get()
+
+
+@contextmanager
+def background_priority() -> Iterator[None]:
+    """Все VK-вызовы внутри блока идут по фоновой полосе."""
+    token = _current_priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def raise_priority(ctx: contextvars.Context, priority: int) -> None:
+    """
+    Повышает приоритет задачи, запущенной с context=ctx, до priority (если он выше
+    текущего): её следующие VK-вызовы идут по этой полосе. Вызывать из другой задачи.
+    """
+    if priority < ctx.get(_current_priority, PRIORITY_INTERACTIVE):
+        ctx.run(_current_priority.set, priority)
+
+
+@dataclass
+class _Bucket:
+    """Состояние token bucket одного токена VK."""
+    tokens: float
+    updated: float
+    lanes: tuple[deque, deque] = field(default_factory=lambda: (deque(), deque()))
+    drainer: asyncio.Task | None = None
+
+
+class VkRateLimiter:
+    """
+    Token bucket на каждый access_token VK (~3 запроса/сек на токен).
+
+    Две полосы ожидания: интерактивная обслуживается раньше фоновой,
+    а фоновая не забирает последние background_reserve токенов корзины —
+    они остаются для запросов пользователя. Поэтому интерактивный запрос
+    никогда не стоит в очереди за пачкой предзагрузки.
+    """
+
+    def __init__(
+            self,
+            rate: float = VK_RATE_LIMIT_PER_SEC,
+            burst: float = VK_RATE_BURST,
+            background_reserve: float = VK_BACKGROUND_RESERVE,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.background_reserve = background_reserve
+        self._buckets: dict[str, _Bucket] = {}
+
+    async def acquire(self, key: str, priority: int = PRIORITY_INTERACTIVE) -> None:
+        """Ждёт, пока для токена key освободится слот запроса."""
+        bucket = self._get_bucket(key)
+        self._refill(bucket)
+
+        # свободный слот и никого не ждём впереди в своей или более приоритетной полосе
+        if not any(bucket.lanes[p] for p in range(priority + 1)) and bucket.tokens >= self._need(priority):
+            bucket.tokens -= 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        bucket.lanes[priority].append(waiter)
+
+        # раздатчик мог уснуть до пополнения резерва для фоновой полосы —
+        # будим его, чтобы интерактивный запрос ждал только свой токен
+        if priority == PRIORITY_INTERACTIVE and bucket.drainer is not None:
+            bucket.drainer.cancel()
+            bucket.drainer = None
+        if bucket.drainer is None or bucket.drainer.done():
+            bucket.drainer = asyncio.create_task(self._drain(bucket))
+        await waiter
+
+    def budget(self, key: str) -> float:
+        """Сколько запросов токен key может сделать прямо сейчас (с учётом ожидающих)."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        self._refill(bucket)
+        return bucket.tokens - sum(len(lane) for lane in bucket.lanes)
+
+    def _need(self, priority: int) -> float:
+        """Сколько токенов должно быть в корзине, чтобы полоса могла взять один."""
+        reserve = self.background_reserve if priority == PRIORITY_BACKGROUND else 0
+        return min(self.burst, 1 + reserve)
+
+    def _get_bucket(self, key: str) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            now = asyncio.get_running_loop().time()
+            bucket = _Bucket(tokens=self.burst, updated=now)
+            self._buckets[key] = bucket
+        return bucket
+
+    def _refill(self, bucket: _Bucket) -> None:
+        now = asyncio.get_running_loop().time()
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+
+    async def _drain(self, bucket: _Bucket) -> None:
+        """Раздаёт токены ожидающим: сначала интерактивной полосе, потом фоновой."""
+        while True:
+            # отменённые ожидания пропускаем
+            for lane in bucket.lanes:
+                while lane and lane[0].done():
+                    lane.popleft()
+
+            priority = next((p for p, lane in enumerate(bucket.lanes) if lane), None)
+            if priority is None:
+                return
+
+            self._refill(bucket)
+            need = self._need(priority)
+            if bucket.tokens >= need:
+                bucket.tokens -= 1
+                bucket.lanes[priority].popleft().set_result(None)
+                continue
+
+            await asyncio.sleep((need - bucket.tokens) / self.rate)
@@ -0,0 +1,112 @@
+# политики повторов по кодам ошибок VK (экспоненциальный backoff с jitter) + circuit breaker на метод
+
+import random
+import time
+from dataclasses import dataclass
+
+from src.core.config import VK_BREAKER_FAILURE_THRESHOLD, VK_BREAKER_RESET_SEC
+
+# внутренний код сетевой ошибки/таймаута (см. VkClient.call)
+NETWORK_ERROR_CODE = -1000
+
+# коды VK, при которых метод считается деградировавшим (считаются breaker'ом)
+BREAKER_CODES = {NETWORK_ERROR_CODE, 10}
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Сколько раз повторять и с какой паузой.
+    Пауза — full jitter: случайная в [0, min(max_delay, base_delay * 2^attempt)],
+    чтобы повторы разных запросов не били в VK одновременно.
+    """
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+
+    def delay(self, attempt: int) -> float:
+        """Пауза перед повтором номер attempt (с 0)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+RETRY_POLICIES: dict[int, RetryPolicy] = {
+    NETWORK_ERROR_CODE: RetryPolicy(max_attempts=2, base_delay=0.4, max_delay=2.0),
+    6: RetryPolicy(max_attempts=4, base_delay=0.5, max_delay=4.0),     # Too many requests per second
+    9: RetryPolicy(max_attempts=3, base_delay=2.0, max_delay=10.0),    # Flood control
+    10: RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=4.0),    # Internal server error
+}
+
+# состояния breaker'а
+STATE_CLOSED = 'closed'          # запросы идут как обычно
+STATE_OPEN = 'open'              # VK деградировал — отказываем сразу, не дёргая сеть
+STATE_HALF_OPEN = 'half_open'    # пробный запрос после паузы
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker одного метода VK.
+    После failure_threshold сбоев подряд (сеть / error 10) размыкается на
+    reset_timeout секунд: вызовы сразу получают ошибку, не создавая шторм повторов.
+    Затем пропускает один пробный запрос: успех замыкает цепь, сбой — снова размыкает.
+    """
+
+    def __init__(
+            self,
+            failure_threshold: int = VK_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout: float = VK_BREAKER_RESET_SEC,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: float | None = None
+        self._trial_started_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return STATE_CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return STATE_HALF_OPEN
+        return STATE_OPEN
+
+    def allow(self) -> bool:
+        """Можно ли сейчас отправить запрос."""
+        state = self.state
+        if state == STATE_CLOSED:
+            return True
+        if state == STATE_HALF_OPEN:
+            # один пробный запрос; если он пропал без ответа (отмена) — через
+            # reset_timeout разрешаем следующий
+            now = time.monotonic()
+            if self._trial_started_at is None or now - self._trial_started_at >= self.reset_timeout:
+                self._trial_started_at = now
+                return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._trial_started_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_started_at = None
+        if self._opened_at is not None or self.failures >= self.failure_threshold:
+            # сбой пробного запроса или порог превышен — (пере)размыкаем
+            self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Пробный запрос завершился без вердикта о здоровье VK (например, error 6)."""
+        self._trial_started_at = None
+
+    def record_error(self, code: int) -> None:
+        """
+        Учёт ошибки вызова: сеть/error 10 — сбой, 6/9 — лимиты токена (без вердикта),
+        остальные ошибки VK (доступ, параметры) — VK отвечает, значит здоров.
+        """
+        if code in BREAKER_CODES:
+            self.record_failure()
+        elif code in RETRY_POLICIES:
+            self.release()
+        else:
+            self.record_success()
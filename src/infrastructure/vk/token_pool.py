@@ -0,0 +1,48 @@
+# пул сервисных/донорских токенов VK для фоновых неперсональных вызовов
+
+import time
+
+from src.core.config import VK_TOKEN_POOL_COOLDOWN_SEC
+from src.infrastructure.vk.rate_limiter import VkRateLimiter
+
+
+class VkTokenPool:
+    """
+    Набор токенов, по которым раскладываются фоновые вызовы (photos.get
+    открытых профилей при предзагрузке), чтобы они не расходовали лимит
+    токена пользователя.
+
+    Выбор токена: больше всего свободного лимита в rate_limiter клиента,
+    при равенстве — давнее всех использованный (LRU).
+    Токен, отвергнутый VK, выводится из пула на cooldown_sec.
+    """
+
+    def __init__(
+            self,
+            tokens: list[str],
+            rate_limiter: VkRateLimiter,
+            cooldown_sec: float = VK_TOKEN_POOL_COOLDOWN_SEC,
+    ):
+        self.tokens = list(dict.fromkeys(tokens))
+        self.rate_limiter = rate_limiter
+        self.cooldown_sec = cooldown_sec
+        self._last_used: dict[str, float] = {}
+        self._disabled_until: dict[str, float] = {}
+
+    def pick(self) -> str | None:
+        """Токен для следующего вызова или None, если живых токенов нет."""
+        now = time.monotonic()
+        alive = [t for t in self.tokens if self._disabled_until.get(t, 0.0) <= now]
+        if not alive:
+            return None
+
+        token = max(alive, key=lambda t: (self.rate_limiter.budget(t), -self._last_used.get(t, 0.0)))
+        self._last_used[token] = now
+        return token
+
+    def disable(self, token: str) -> None:
+        """Выводит токен из пула на cooldown_sec (например, VK ответил error 5)."""
+        self._disabled_until[token] = time.monotonic() + self.cooldown_sec
+
+    def __len__(self) -> int:
+        return len(self.tokens)
@@ -6,11 +6,18 @@ import os
 from src.application.services.auth_service import AuthService
 from src.application.services.dating_service import DatingService
 from src.application.services.photo_processing_service import PhotoProcessingService
+from src.application.services.profile_refresh_service import ProfileRefreshService
 from src.infrastructure.db.repositories import InMemoryUserRepo
+from src.infrastructure.storage.photo_cache import PhotoCacheManager
+from src.infrastructure.vk.batcher import VkBatcher
+from src.infrastructure.vk.cache import VkResponseCache
 from src.infrastructure.vk.client import VkClient
 from src.infrastructure.vk.methods import VkMethods
+from src.infrastructure.vk.token_pool import VkTokenPool
 from src.presentation.tg.handlers import setup_handlers
-from src.core.config import TG_TOKEN, CLEAN_DB_ON_START
+from src.core.config import (
+    TG_TOKEN, CLEAN_DB_ON_START, VK_EXECUTE_BATCHING, VK_RESPONSE_CACHE, VK_SERVICE_TOKENS,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -18,10 +25,10 @@ from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 
-def setup_bot(token: str) -> tuple[Dispatcher, Bot, PhotoProcessingService]:
+def setup_bot(token: str) -> tuple[Dispatcher, Bot, PhotoProcessingService, VkClient, PhotoCacheManager]:
     """
     Собирает бота и диспетчер так, чтобы можно было тестить другим token.
-    Возвращает (dp, bot, photo_service).
+    Возвращает (dp, bot, photo_service, vk_client, photo_cache).
     """
     # FSM память
     storage = MemoryStorage()
@@ -39,7 +46,13 @@ def setup_bot(token: str) -> tuple[Dispatcher, Bot, PhotoProcessingService]:
 
     # VK слой (не содержит токен — токен передаём параметром в методы)
     vk_client = VkClient()
-    vk_methods = VkMethods(client=vk_client)
+    # батчинг: близкие вызовы одного токена склеиваются в один execute
+    vk_batcher = VkBatcher(client=vk_client) if VK_EXECUTE_BATCHING else None
+    # кэш ответов идемпотентных методов (включается VK_RESPONSE_CACHE=true)
+    vk_cache = VkResponseCache() if VK_RESPONSE_CACHE else None
+    # пул сервисных токенов для фоновых photos.get (включается VK_SERVICE_TOKENS)
+    vk_token_pool = VkTokenPool(VK_SERVICE_TOKENS, rate_limiter=vk_client.rate_limiter) if VK_SERVICE_TOKENS else None
+    vk_methods = VkMethods(client=vk_client, batcher=vk_batcher, cache=vk_cache, token_pool=vk_token_pool)
 
     # Сервис авторизации: валидирует и сохраняет
     auth_service = AuthService(vk=vk_methods, user_repo=user_repo)
@@ -47,19 +60,26 @@ def setup_bot(token: str) -> tuple[Dispatcher, Bot, PhotoProcessingService]:
     # Сервис обработки фото: скачивание + (позже) InsightFace
     photo_service = PhotoProcessingService(vk=vk_methods, user_repo=user_repo)
 
+    # Уборка папки фото: бюджет диска + удаление неиспользуемых файлов
+    photo_cache = PhotoCacheManager(store=photo_service.store, user_repo=user_repo)
+
     # Сервис знакомств: поиск кандидатов, навигация по очереди
     dating_service = DatingService(vk=vk_methods, user_repo=user_repo, _photo_service=photo_service)
 
+    # Обновление профилей избранного и очереди пачками users.get
+    profile_refresh = ProfileRefreshService(vk=vk_methods, user_repo=user_repo)
+
     router = setup_handlers(
         user_repo=user_repo,
         auth_service=auth_service,
         dating_service=dating_service,
         photo_service=photo_service,
+        profile_refresh=profile_refresh,
     )
     dp.include_router(router=router)
 
     bot = Bot(token=token, default=DefaultBotProperties(parse_mode="HTML"))
-    return dp, bot, photo_service
+    return dp, bot, photo_service, vk_client, photo_cache
 
 
 async def _clean_db() -> None:
@@ -69,11 +89,13 @@ async def _clean_db() -> None:
         return
 
     from src.infrastructure.db.session import create_session_factory
-    from src.infrastructure.db.models import User, QueueItem, FavoriteProfile, Blacklist, Profile, Photo
+    from src.infrastructure.db.models import (
+        User, QueueItem, FavoriteProfile, Blacklist, Profile, Photo, NoPhotoCandidate,
+    )
 
     sf = create_session_factory(database_url)
     async with sf() as s:
-        for table in (Photo, QueueItem, FavoriteProfile, Blacklist, Profile, User):
+        for table in (Photo, NoPhotoCandidate, QueueItem, FavoriteProfile, Blacklist, Profile, User):
             from sqlalchemy import delete
             await s.execute(delete(table))
         await s.commit()
@@ -81,19 +103,33 @@ async def _clean_db() -> None:
 
 
 async def start_bot() -> None:
+    # получаем Dispatcher, Bot, PhotoProcessingService, VkClient, PhotoCacheManager
+    dp, bot, photo_service, vk_client, photo_cache = setup_bot(token=TG_TOKEN)
+
+    # прогрев InsightFace детектора — первым: воркеры пула процессов порождаются
+    # fork'ом, пока в процессе нет пулов соединений, сессий БД и фоновых задач
+    await photo_service.warm_up_detector()
+
     # очистка БД при старте (если включена)
     if CLEAN_DB_ON_START:
         await _clean_db()
 
-    # получаем Dispatcher, Bot, PhotoProcessingService
-    dp, bot, photo_service = setup_bot(token=TG_TOKEN)
+    # открываем пулы соединений VK API и CDN фото на всё время работы бота
+    await vk_client.start()
+    await photo_service.downloader.start()
 
-    # прогрев InsightFace детектора (в thread pool, не блокирует)
-    await photo_service.warm_up_detector()
+    # фоновая уборка папки фото
+    await photo_cache.start()
 
     # запуск бота
     try:
         await dp.start_polling(bot)
     finally:
         await bot.session.close() # закрытие сессии бота
+        if photo_service.vk.batcher is not None:
+            await photo_service.vk.batcher.close()  # отмена неотправленных пачек execute
+        await vk_client.close()   # закрытие пула соединений VK
+        await photo_service.downloader.close()  # закрытие пула соединений CDN фото
+        await photo_cache.close()               # остановка уборки папки фото
+        await photo_service.vision.close()      # остановка воркеров InsightFace
 
@@ -1,11 +1,11 @@
 # обработчики: /start, токен, фильтры, навигация, избранное
 
 import asyncio
-from pathlib import Path
 
 from src.application.services.auth_service import AuthService
 from src.application.services.dating_service import DatingService
 from src.application.services.photo_processing_service import PhotoProcessingService
+from src.application.services.profile_refresh_service import ProfileRefreshService
 from src.presentation.tg.states import AuthState, FilterState, MenuState
 from src.core.exceptions import VkApiError
 from src.presentation.tg.keyboards import (
@@ -24,7 +24,8 @@ def setup_handlers(
         user_repo: UserRepo,
         auth_service: AuthService,
         dating_service: DatingService,
-        photo_service: PhotoProcessingService
+        photo_service: PhotoProcessingService,
+        profile_refresh: ProfileRefreshService
 ) -> Router:
     router = Router()
 
@@ -205,7 +206,7 @@ def setup_handlers(
 
         tg_user_id = message.from_user.id
 
-        await user_repo.update_filters(
+        await dating_service.update_filters(
             tg_user_id=tg_user_id,
             city=city,
             gender=gender,
@@ -240,8 +241,15 @@ def setup_handlers(
         # получаем профиль и фото
         profile, photos = await dating_service.get_candidate_card(tg_user_id)
 
+        # профиль закрылся после попадания в очередь (по обновлению профилей) —
+        # фото не показать, сразу к пропуску
+        closed = profile is not None and profile.is_closed
+        if closed:
+            photos = []
+
         # скачиваем и обрабатываем фото если ещё не готовы
-        if not photos:
+        # (кандидатов из негативного кэша не трогаем — сразу к пропуску)
+        if not closed and not photos and not await user_repo.get_no_photo_ids([vk_id]):
             user = await user_repo.get_or_create_user(tg_user_id)
             if user.vk_access_token:
                 loading_msg = await message.answer("Ищу фото кандидата...")
@@ -258,10 +266,11 @@ def setup_handlers(
                     except Exception:
                         pass
 
-        local_photos = [
-            p for p in photos
-            if p.status == 'selected' and p.local_path and Path(p.local_path).exists()
-        ]
+        # файлы выбранных фото могли быть вытеснены с диска — докачиваем и пережимаем
+        if photos:
+            photos = await photo_service.restore_missing(vk_id, photos)
+
+        local_photos = await photo_service.shown_photos(photos)
 
         # если фото нет — пропускаем кандидата автоматически
         if not local_photos:
@@ -301,8 +310,8 @@ def setup_handlers(
         # отправляем фото
         if len(local_photos) >= 2:
             media = []
-            for i, photo in enumerate(local_photos):
-                inp = FSInputFile(photo.local_path)
+            for i, (_, path) in enumerate(local_photos):
+                inp = FSInputFile(path)
                 if i == 0:
                     media.append(InputMediaPhoto(media=inp, caption=text))
                 else:
@@ -310,9 +319,12 @@ def setup_handlers(
             await message.answer_media_group(media=media)
             await message.answer("Выберите действие:", reply_markup=kb_main())
         else:
-            inp = FSInputFile(local_photos[0].local_path)
+            inp = FSInputFile(local_photos[0][1])
             await message.answer_photo(photo=inp, caption=text, reply_markup=kb_main())
 
+        # отмечаем показ — давно не показанные фото первыми вытесняются с диска
+        await photo_service.touch_shown([photo for photo, _ in local_photos])
+
     # Меню Главное MenuState.main
     ## Переход в меню Дополнительно
     @router.message(MenuState.main, F.text == 'Дополнительно')
@@ -338,6 +350,8 @@ def setup_handlers(
 
         # фоновая предзагрузка следующих 5 анкет
         asyncio.create_task(dating_service.preload_ahead(tg_user_id))
+        # и обновление профилей очереди (не чаще раза в PROFILE_REFRESH_INTERVAL_SEC)
+        profile_refresh.schedule(tg_user_id)
 
     ## Показать предыдущего кандидата
     @router.message(MenuState.main, F.text == 'Предыдущий')
@@ -404,6 +418,9 @@ def setup_handlers(
             await message.answer('Список избранного пуст', reply_markup=kb_more())
             return
 
+        # фоном освежаем профили избранного и очереди (пачками users.get)
+        profile_refresh.schedule(tg_user_id)
+
         # переходим в меню управления избранным
         await state.set_state(MenuState.favorites)
         # reply клавиатура с кнопками "Удалить из избранного" и "Назад"
@@ -451,23 +468,25 @@ def setup_handlers(
             text = f"vk.com/id{vk_profile_id}"
 
         # отправляем фото (только selected)
-        local_photos = [
-            p for p in photos
-            if p.status == 'selected' and p.local_path and Path(p.local_path).exists()
-        ]
+        # файлы выбранных фото могли быть вытеснены с диска — докачиваем и пережимаем
+        if photos:
+            photos = await photo_service.restore_missing(vk_profile_id, photos)
+
+        local_photos = await photo_service.shown_photos(photos)
         if local_photos:
             if len(local_photos) >= 2:
                 media = []
-                for i, photo in enumerate(local_photos):
-                    inp = FSInputFile(photo.local_path)
+                for i, (_, path) in enumerate(local_photos):
+                    inp = FSInputFile(path)
                     if i == 0:
                         media.append(InputMediaPhoto(media=inp, caption=text))
                     else:
                         media.append(InputMediaPhoto(media=inp))
                 await callback.message.answer_media_group(media=media)
             else:
-                inp = FSInputFile(local_photos[0].local_path)
+                inp = FSInputFile(local_photos[0][1])
                 await callback.message.answer_photo(photo=inp, caption=text)
+            await photo_service.touch_shown([photo for photo, _ in local_photos])
         else:
             await callback.message.answer(text)
 